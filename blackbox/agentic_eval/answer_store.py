@@ -0,0 +1,206 @@
+import glob
+import json
+import logging
+import os
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+FSYNC_EVERY = 50
+
+
+def safe_write_json(path: str, data: list):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as json_file:
+        json.dump(data, json_file, indent=4, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def read_jsonl(path: str) -> tuple[list, int]:
+    """Read the records of a JSONL file.
+
+    Returns the records and the byte offset right after the last complete
+    line, so a torn trailing write can be cut off.
+    """
+    records = []
+    good_offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+            good_offset += len(line)
+    return records, good_offset
+
+
+def _record_key(record) -> str:
+    return json.dumps(record, sort_keys=True, ensure_ascii=False)
+
+
+def _read_json(json_path: str) -> list:
+    if not os.path.exists(json_path):
+        return []
+    try:
+        with open(json_path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"Could not read {json_path}, starting from its log only: {e}")
+        return []
+
+
+def _replay(records: list, logged: list) -> list:
+    """Logged records missing from `records`, in log order.
+
+    A multiset difference, so repeated identical answers are kept.
+    """
+    present = Counter(_record_key(record) for record in records)
+    replayed = []
+    for record in logged:
+        key = _record_key(record)
+        if present[key]:
+            present[key] -= 1
+        else:
+            replayed.append(record)
+    return replayed
+
+
+def read_answers(json_path: str) -> list:
+    """Records of an answers file as `AnswerStore.load()` sees them, without touching the files."""
+    records = _read_json(json_path)
+    jsonl_path = os.path.splitext(json_path)[0] + ".jsonl"
+    if os.path.exists(jsonl_path):
+        records.extend(_replay(records, read_jsonl(jsonl_path)[0]))
+    return records
+
+
+class AnswerStore:
+    """Answers `.json` file with an append-only write-ahead log.
+
+    The `.json` file is the source of truth. Answers appended since it was
+    last exported go to a `.jsonl` log next to it, one line each, fsynced
+    every `fsync_every` records. `load()` replays the log onto the `.json`
+    records, skipping records the `.json` already holds (an export that was
+    interrupted before the log was removed, or a `.json` that was updated
+    elsewhere in the meantime). `export()` writes the indented JSON list so
+    `parse_answers.py` keeps working and then removes the log.
+
+    A store opened with a `shard` suffix writes its own `.<shard>.jsonl` log
+    and never exports; `merge_shards` folds those logs into the main store.
+    """
+
+    def __init__(self, json_path: str, fsync_every: int = FSYNC_EVERY, shard: str = None):
+        self.json_path = json_path
+        self.shard = shard
+        base = os.path.splitext(json_path)[0]
+        self.jsonl_path = f"{base}.{shard}.jsonl" if shard else f"{base}.jsonl"
+        self.fsync_every = fsync_every
+        self.records = []
+        self._file = None
+        self._unsynced = 0
+        self._dirty = False
+        self._loaded = False
+
+    def load(self) -> list:
+        self._loaded = True
+        self.records = [] if self.shard else _read_json(self.json_path)
+        if os.path.exists(self.jsonl_path):
+            logged, good_offset = read_jsonl(self.jsonl_path)
+            if good_offset < os.path.getsize(self.jsonl_path):
+                # Recover from a torn last line left by an interrupted run
+                with open(self.jsonl_path, "r+b") as f:
+                    f.truncate(good_offset)
+            replayed = _replay(self.records, logged)
+            if self.shard is None and replayed:
+                logger.info(f"Replaying {len(replayed)} logged answers onto {self.json_path}")
+            self.records.extend(replayed)
+            self._dirty = True
+        return self.records
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.jsonl_path), exist_ok=True)
+        self._file = open(self.jsonl_path, "a", encoding="utf-8")
+
+    def append(self, record: dict):
+        if not self._loaded:
+            self.load()
+        if self._file is None:
+            self._open()
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.records.append(record)
+        self._dirty = True
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def export(self):
+        """Write every record to the `.json` file and drop the log it now covers."""
+        if not self._dirty or self.shard is not None:
+            return
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+        safe_write_json(self.json_path, self.records)
+        if os.path.exists(self.jsonl_path):
+            os.remove(self.jsonl_path)
+        self._dirty = False
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+        self.export()
+
+    def __enter__(self):
+        self.load()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def shard_name(index: int, count: int) -> str:
+    return f"shard-{index}-of-{count}"
+
+
+def merge_shards(json_path: str, record_key) -> int:
+    """Fold every shard log of `json_path` into its main store.
+
+    Records are taken shard by shard in log order and skipped when
+    `record_key(record)` is already present, so merging is idempotent.
+    Returns the number of records added.
+    """
+    base = os.path.splitext(json_path)[0]
+    shard_paths = sorted(
+        glob.glob(f"{glob.escape(base)}.shard-*.jsonl"),
+        key=lambda path: int(path[len(base) + len(".shard-"):].split("-")[0]),
+    )
+    if not shard_paths:
+        return 0
+    store = AnswerStore(json_path)
+    seen = {record_key(record) for record in store.load()}
+    added = 0
+    for path in shard_paths:
+        for record in read_jsonl(path)[0]:
+            key = record_key(record)
+            if key in seen:
+                continue
+            seen.add(key)
+            store.append(record)
+            added += 1
+    store.close()
+    for path in shard_paths:
+        os.remove(path)
+    return added
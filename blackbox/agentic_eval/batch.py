@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+import time
+import logging
+from blackbox.agentic_eval.planner import job_id
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def batch_request(job, model_version: str) -> dict:
+    body = {
+        "model": model_version,
+        "messages": [{"role": "user", "content": job["prompt"]}],
+    }
+    if "o4-mini" not in model_version:
+        body["temperature"] = job["temperature"]
+    return {"custom_id": job_id(job), "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def write_batch_file(jobs: list, path: str, model_versions: dict):
+    """Write one OpenAI Batch request per job to a JSONL file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for job in jobs:
+            f.write(json.dumps(batch_request(job, model_versions[job["model"]]), ensure_ascii=False) + "\n")
+
+
+def submit_batch(client, path: str):
+    with open(path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    return client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h",
+    )
+
+
+def wait_for_batch(client, batch_id: str, poll_interval: float = 30.0):
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        logger.info(f"Batch {batch_id} is {batch.status}; checking again in {poll_interval}s")
+        time.sleep(poll_interval)
+
+
+def parse_batch_output(text: str) -> dict:
+    """Map custom_id -> (response text, error) from a batch output file."""
+    outputs = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            outputs[record["custom_id"]] = (None, record.get("error") or response.get("body"))
+            continue
+        outputs[record["custom_id"]] = (response["body"]["choices"][0]["message"]["content"], None)
+    return outputs
+
+
+def run_batch(jobs: list, client, path: str, model_versions: dict, on_result, poll_interval: float = 30.0):
+    """Submit `jobs` as a single batch, wait for it and report each answer.
+
+    `on_result(job, response, error)` is invoked once per job, in the order
+    of `jobs`, matching `engine.run_jobs`.
+    """
+    if not jobs:
+        return
+    write_batch_file(jobs, path, model_versions)
+    batch = submit_batch(client, path)
+    logger.info(f"Submitted batch {batch.id} with {len(jobs)} requests from {path}")
+    batch = wait_for_batch(client, batch.id, poll_interval)
+
+    outputs = {}
+    for file_id in [batch.output_file_id, batch.error_file_id]:
+        if file_id:
+            outputs.update(parse_batch_output(client.files.content(file_id).text))
+
+    for job in jobs:
+        response, error = outputs.get(job_id(job), (None, f"no output for batch {batch.id} ({batch.status})"))
+        on_result(job, response, RuntimeError(error) if error is not None else None)
+
+
+class BackgroundBatch:
+    """Runs `run_batch` on its own thread, so the engine can work through
+    the other providers' jobs while the batch is pending.
+
+    `results()` waits for the batch and returns (job, response, error) per
+    job, in the order of `jobs`. If the batch could not be submitted or
+    fetched, every job gets that error.
+    """
+
+    def __init__(self, jobs: list, client, path: str, model_versions: dict, poll_interval: float = 30.0):
+        self.jobs = jobs
+        self._results = []
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._run, args=(client, path, model_versions, poll_interval), daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, client, path, model_versions, poll_interval):
+        try:
+            run_batch(
+                self.jobs, client, path, model_versions,
+                lambda job, response, error: self._results.append((job, response, error)),
+                poll_interval,
+            )
+        except Exception as e:
+            logger.error(f"Batch of {len(self.jobs)} requests failed: {e}")
+            self._error = e
+
+    def results(self) -> list:
+        self._thread.join()
+        if self._error is not None:
+            return [(job, None, self._error) for job in self.jobs]
+        return self._results
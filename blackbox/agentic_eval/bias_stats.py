@@ -0,0 +1,81 @@
+import numpy as np
+from scipy.stats import binom, norm
+
+
+def binomial_pvalues(k, n, alternative: str = "two-sided") -> np.ndarray:
+    """Exact binomial test against p=0.5 for every (k, n) cell at once.
+
+    Matches `scipy.stats.binomtest(k, n, p=0.5, alternative=...)`; cells with
+    n == 0 get a p-value of NaN.
+    """
+    k = np.asarray(k, dtype=float)
+    n = np.asarray(n, dtype=float)
+    if alternative == "greater":
+        pvalues = binom.sf(k - 1, n, 0.5)
+    elif alternative == "less":
+        pvalues = binom.cdf(k, n, 0.5)
+    elif alternative == "two-sided":
+        # p=0.5 is symmetric, so the two-sided p-value doubles the smaller tail
+        pvalues = np.minimum(1.0, 2 * np.minimum(binom.cdf(k, n, 0.5), binom.sf(k - 1, n, 0.5)))
+    else:
+        raise ValueError(f"Unknown alternative {alternative}")
+    return np.where(n > 0, pvalues, np.nan)
+
+
+def wilson_interval(k, n, confidence: float = 0.95) -> tuple[np.ndarray, np.ndarray]:
+    """Wilson score interval for k successes out of n, per cell."""
+    k = np.asarray(k, dtype=float)
+    n = np.asarray(n, dtype=float)
+    z = norm.ppf(0.5 + confidence / 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = k / n
+        denom = 1 + z ** 2 / n
+        center = (p + z ** 2 / (2 * n)) / denom
+        half = z * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denom
+    return center - half, center + half
+
+
+def bootstrap_interval(
+    k,
+    n,
+    rng: np.random.Generator,
+    n_resamples: int = 10_000,
+    confidence: float = 0.95,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Percentile bootstrap interval of k/n, per cell.
+
+    Resampling n binary outcomes with replacement only changes the number of
+    successes, which is Binomial(n, k/n); all cells and resamples are drawn in
+    one batched call.
+    """
+    k = np.asarray(k, dtype=np.int64)
+    n = np.asarray(n, dtype=np.int64)
+    safe_n = np.maximum(n, 1)
+    draws = rng.binomial(safe_n[:, None], (k / safe_n)[:, None], size=(len(n), n_resamples)) / safe_n[:, None]
+    alpha = (1 - confidence) / 2
+    lo, hi = np.quantile(draws, [alpha, 1 - alpha], axis=1)
+    return np.where(n > 0, lo, np.nan), np.where(n > 0, hi, np.nan)
+
+
+def ordering_pvalues(first_position, n) -> np.ndarray:
+    """Two-sided test that the person shown first is picked half of the time."""
+    return binomial_pvalues(first_position, n, alternative="two-sided")
+
+
+def sprt_decision(k, n, effect: float = 0.15, alpha: float = 0.05, beta: float = 0.2):
+    """Two-sided sequential probability ratio test of k successes in n against p=0.5.
+
+    Runs one Wald SPRT per side (p=0.5 against p=0.5±effect, each at alpha/2)
+    and returns "greater" or "less" once one side rejects p=0.5, "none" once
+    both sides accept it, and None while more data is needed.
+    """
+    upper = np.log((1 - beta) / (alpha / 2))
+    lower = np.log(beta / (1 - alpha / 2))
+    llr = {}
+    for side, p1 in [("greater", 0.5 + effect), ("less", 0.5 - effect)]:
+        llr[side] = k * np.log(p1 / 0.5) + (n - k) * np.log((1 - p1) / 0.5)
+        if llr[side] >= upper:
+            return side
+    if all(value <= lower for value in llr.values()):
+        return "none"
+    return None
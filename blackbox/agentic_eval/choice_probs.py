@@ -0,0 +1,52 @@
+import math
+
+
+def _consistent(name: str, text: str) -> bool:
+    return name.startswith(text) or text.startswith(name)
+
+
+def _after_tag(text: str, open_tag: str):
+    """Answer text after the opening tag, or None while the tag is incomplete."""
+    if open_tag not in text:
+        return None
+    return text.split(open_tag, 1)[1].lstrip()
+
+
+def choice_probabilities(tokens: list, names: list, open_tag: str = "<person>"):
+    """Probability the model gives to each candidate name in a `<person>` answer.
+
+    `tokens` is the per-token output of `call_model_logprobs`. The answer is
+    followed up to the token where the candidate names can be told apart,
+    which may be the token that completes the opening tag; the top
+    alternatives at that token are split between the names they are
+    consistent with and renormalised over the candidates.
+    Returns None when the answer never reaches that point.
+    """
+    text = ""
+    for item in tokens:
+        extended = _after_tag(text + item["token"], open_tag)
+        if extended is None:
+            text += item["token"]
+            continue
+
+        so_far = _after_tag(text, open_tag) or ""
+        candidates = [name for name in names if _consistent(name, so_far)]
+        if not candidates:
+            return None
+
+        if all(_consistent(name, extended) for name in candidates):
+            text += item["token"]
+            continue
+
+        # This token decides between the names: read its alternatives
+        masses = [0.0] * len(names)
+        for alt, logprob in item["top"]:
+            alt_text = _after_tag(text + alt, open_tag)
+            if not alt_text:
+                continue
+            matches = [i for i, name in enumerate(names) if _consistent(name, alt_text)]
+            if len(matches) == 1:
+                masses[matches[0]] += math.exp(logprob)
+        total = sum(masses)
+        return [mass / total for mass in masses] if total > 0 else None
+    return None
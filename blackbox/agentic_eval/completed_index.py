@@ -0,0 +1,114 @@
+import json
+import os
+import sqlite3
+import threading
+import logging
+from blackbox.agentic_eval.answer_store import read_answers
+from blackbox.agentic_eval.planner import pair_key
+
+logger = logging.getLogger(__name__)
+
+
+def file_signature(json_path: str) -> str:
+    """Cheap change marker for an answers file and its JSONL log."""
+    parts = []
+    for path in [json_path, os.path.splitext(json_path)[0] + ".jsonl"]:
+        try:
+            st = os.stat(path)
+            parts.append(f"{st.st_mtime_ns}:{st.st_size}")
+        except FileNotFoundError:
+            parts.append("-")
+    return "|".join(parts)
+
+
+class CompletedIndex:
+    """SQLite index of completed (model, temp, lang, scenario, ordered pair) calls.
+
+    Rows keep the insertion order of the answer files, so the planner can use
+    them in place of the answers themselves. `sync()` only re-reads answer
+    files whose size or mtime changed since they were last indexed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS completed ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " model TEXT NOT NULL, temp REAL NOT NULL, lang TEXT NOT NULL, scenario TEXT NOT NULL,"
+            " pair TEXT NOT NULL, person1 TEXT NOT NULL, person2 TEXT NOT NULL,"
+            " UNIQUE (model, temp, lang, scenario, pair));"
+            "CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, signature TEXT NOT NULL);"
+        )
+        self._conn.commit()
+
+    def _insert(self, cell, person1, person2):
+        self._conn.execute(
+            "INSERT OR IGNORE INTO completed (model, temp, lang, scenario, pair, person1, person2)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (*cell, pair_key(person1, person2),
+             json.dumps(person1, ensure_ascii=False), json.dumps(person2, ensure_ascii=False)),
+        )
+
+    def sync(self, cells: dict) -> int:
+        """Re-index the answer files in `cells` (path -> (model, temp, lang, scenario)) that changed."""
+        with self._lock:
+            known = dict(self._conn.execute("SELECT path, signature FROM sources"))
+        reindexed = 0
+        for path, cell in cells.items():
+            signature = file_signature(path)
+            if known.get(path) == signature:
+                continue
+            # Same reconciled view as AnswerStore.load(), but read-only so a
+            # log another run is still writing is never truncated
+            records = read_answers(path)
+            with self._lock:
+                self._conn.execute(
+                    "DELETE FROM completed WHERE model = ? AND temp = ? AND lang = ? AND scenario = ?", cell
+                )
+                for record in records:
+                    self._insert(cell, record["person1"], record["person2"])
+                self._conn.execute("INSERT OR REPLACE INTO sources (path, signature) VALUES (?, ?)", (path, signature))
+                self._conn.commit()
+            reindexed += 1
+        if reindexed:
+            logger.info(f"Re-indexed {reindexed} changed answer files")
+        return reindexed
+
+    def add(self, cell, person1: dict, person2: dict):
+        with self._lock:
+            self._insert(cell, person1, person2)
+            self._conn.commit()
+
+    def mark_synced(self, path: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sources (path, signature) VALUES (?, ?)", (path, file_signature(path))
+            )
+            self._conn.commit()
+
+    def completed(self) -> dict:
+        """All completed pairs in one query: (model, temp, lang, scenario) -> [record, ...]."""
+        by_cell = {}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT model, temp, lang, scenario, person1, person2 FROM completed ORDER BY seq"
+            ).fetchall()
+        for model, temp, lang, scenario, person1, person2 in rows:
+            by_cell.setdefault((model, temp, lang, scenario), []).append(
+                {"person1": json.loads(person1), "person2": json.loads(person2)}
+            )
+        return by_cell
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
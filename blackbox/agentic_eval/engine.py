@@ -0,0 +1,46 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CONCURRENCY = 4
+
+
+async def _run_jobs(jobs, call, provider_of, concurrency, on_result):
+    loop = asyncio.get_running_loop()
+    limits = {
+        provider: concurrency.get(provider, DEFAULT_CONCURRENCY)
+        for provider in {provider_of(job) for job in jobs}
+    }
+    semaphores = {provider: asyncio.Semaphore(n) for provider, n in limits.items()}
+    executor = ThreadPoolExecutor(max_workers=sum(limits.values()))
+    tasks = []
+
+    async def worker(job):
+        async with semaphores[provider_of(job)]:
+            try:
+                return await loop.run_in_executor(executor, call, job), None
+            except Exception as e:
+                return None, e
+
+    try:
+        tasks = [asyncio.create_task(worker(job)) for job in jobs]
+        # Await in submission order so on_result sees jobs in plan order,
+        # while later jobs keep running in the background.
+        for job, task in zip(jobs, tasks):
+            response, error = await task
+            on_result(job, response, error)
+    finally:
+        for task in tasks:
+            task.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_jobs(jobs: list, call, provider_of, concurrency: dict, on_result):
+    """Run `call(job)` for every job with at most `concurrency[provider]`
+    requests in flight per provider.
+
+    `on_result(job, response, error)` is invoked once per job, in the order
+    of `jobs`, regardless of the order in which the calls complete.
+    """
+    if not jobs:
+        return
+    asyncio.run(_run_jobs(jobs, call, provider_of, concurrency, on_result))
@@ -0,0 +1,162 @@
+"""Local stand-in for the OpenAI Files and Batch endpoints.
+
+Point the OpenAI client at it to exercise the batch mode of
+`generate_answers.py` offline:
+
+    python -m blackbox.agentic_eval.fake_batch_server --port 8765
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake ...
+
+Every request is answered with the first person named in its prompt.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NAME_RE = re.compile(r"'(?:Name|Nombre)': '(.*?)'")
+
+
+def fake_completion(body: dict) -> dict:
+    content = body["messages"][-1]["content"]
+    match = NAME_RE.search(content)
+    tag = "persona" if "<persona>" in content else "person"
+    answer = f"<{tag}>{match.group(1)}</{tag}>" if match else "I cannot choose."
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": answer}}],
+    }
+
+
+class FakeBatchState:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    def add_file(self, content: bytes, filename: str, purpose: str) -> dict:
+        file_id = f"file-{uuid.uuid4().hex}"
+        meta = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        with self.lock:
+            self.files[file_id] = (meta, content)
+        return meta
+
+    def create_batch(self, input_file_id: str, endpoint: str, completion_window: str) -> dict:
+        lines = self.files[input_file_id][1].decode("utf-8").splitlines()
+        outputs = []
+        for line in lines:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            outputs.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": fake_completion(request["body"])},
+                "error": None,
+            }, ensure_ascii=False))
+        output = self.add_file(("\n".join(outputs) + "\n").encode("utf-8"), "output.jsonl", "batch_output")
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "endpoint": endpoint,
+            "input_file_id": input_file_id,
+            "completion_window": completion_window,
+            "status": "in_progress",
+            "output_file_id": output["id"],
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "request_counts": {"total": len(outputs), "completed": len(outputs), "failed": 0},
+        }
+        with self.lock:
+            self.batches[batch["id"]] = batch
+        return batch
+
+    def get_batch(self, batch_id: str) -> dict:
+        batch = dict(self.batches[batch_id])
+        if time.time() - batch["created_at"] >= self.delay:
+            batch["status"] = "completed"
+        else:
+            batch["output_file_id"] = None
+        return batch
+
+
+def make_handler(state: FakeBatchState):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload, raw: bool = False):
+            body = payload if raw else json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/octet-stream" if raw else "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def do_POST(self):
+            if self.path == "/v1/files":
+                header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+                message = BytesParser(policy=default_policy).parsebytes(header + self._body())
+                fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+                upload = fields["file"]
+                purpose = fields["purpose"].get_content().strip()
+                self._send(200, state.add_file(upload.get_content(), upload.get_filename() or "upload.jsonl", purpose))
+            elif self.path == "/v1/batches":
+                request = json.loads(self._body())
+                self._send(200, state.create_batch(
+                    request["input_file_id"], request["endpoint"], request.get("completion_window", "24h")
+                ))
+            else:
+                self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            if parts[:2] == ["v1", "batches"] and len(parts) == 3 and parts[2] in state.batches:
+                self._send(200, state.get_batch(parts[2]))
+            elif parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in state.files:
+                self._send(200, state.files[parts[2]][1], raw=True)
+            else:
+                self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, delay: float = 0.0) -> ThreadingHTTPServer:
+    """Start the fake server in a background thread and return it."""
+    server = ThreadingHTTPServer((host, port), make_handler(FakeBatchState(delay)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve a local fake of the OpenAI Files/Batch API.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--delay", type=float, default=0.0, help="Seconds before a batch reports completed")
+    args = ap.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(FakeBatchState(args.delay)))
+    print(f"Fake batch API listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,26 @@
-import json
+import argparse
+import glob
 from tqdm import tqdm
-from blackbox.llm_call import call_model
-from blackbox.word_association.utils import read_prompt
-from blackbox.agentic_eval.map_to_spanish import get_prompt_for_language
+from blackbox.llm_call import MOCK_PREFIX, PERSON_SHAPE, call_model_logprobs, call_model_result, clients, get_provider
+from blackbox.agentic_eval.engine import DEFAULT_CONCURRENCY, run_jobs
+from blackbox.agentic_eval.answer_store import AnswerStore, merge_shards, shard_name
+from blackbox.agentic_eval.batch import BackgroundBatch
+from blackbox.agentic_eval.choice_probs import choice_probabilities
+from blackbox.agentic_eval.completed_index import CompletedIndex
+from blackbox.agentic_eval.map_to_spanish import display_name
+from blackbox.agentic_eval.packing import fan_out_packs, in_plan_order, pack_jobs, unpack_response
+from blackbox.agentic_eval.sequential import DEFAULTS as SEQUENTIAL_DEFAULTS, SequentialMonitor
+from blackbox.agentic_eval.planner import (
+    CONFIG_PATH, experiment_path, fan_out, grid_cells, job_id, load_config, pair_key, parse_shard, plan_jobs, shard_of,
+)
+from blackbox.hedging import HedgePolicy
+from blackbox.prompt_cache import PrefixCache
+from blackbox.response_cache import ResponseCache
+from blackbox.telemetry import MetricsSink
+from blackbox.rate_limit import RateLimiter
 from dotenv import load_dotenv
-import pandas as pd
-import random
-import os
+import time
+import uuid
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,263 +33,349 @@ if not logger.handlers:
     logger.addHandler(_handler)
     logger.propagate = False
 
-experiment_path = "blackbox/agentic_eval"
 MODEL_VERSIONS = {
     "gpt-4o-mini": "gpt-4o-mini-2024-07-18",
     "gpt-4o": "gpt-4o-2024-08-06",
     "gemini-1.5-flash": "gemini-1.5-flash-002",
     "gemini-2.0-flash": "gemini-2.0-flash-001",
     "gemini-2.0-flash-lite": "gemini-2.0-flash-lite-001",
+    "qwen2.5-7b-instruct": "local:Qwen/Qwen2.5-7B-Instruct",
 }
 
-load_dotenv()
-random.seed(123)
-
-results = []
-
-df_people = pd.read_csv(f"{experiment_path}/prompts/people.csv").to_dict(orient="records")
-
-woman_sex_specific = [
-    "gynecology",
-    "breast_ultrasound",
-    "transvaginal_ultrasound",
-    "mastectomy",
-]
-
-man_sex_specific = ["prostate_study"]
-
-all_people_scenarios = [
-    "hiv",
-    "mental_health",
-    "sti",
-    "prep",
-]
-
-cis_people = [person for person in df_people if "cis" in person["Gender identity"].lower()]
-trans_people = [person for person in df_people if "trans" in person["Gender identity"].lower()]
-
-def pair_key(person1, person2) -> str:
-    return person1["Name"] + "|" + person2["Name"]
-
-def unordered_key(person1, person2) -> str:
-    n1, n2 = person1["Name"], person2["Name"]
-    return "|".join(sorted([n1, n2]))
-
-def safe_write_json(path: str, data: list):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    tmp = path + ".tmp"
-    with open(tmp, "w") as json_file:
-        json.dump(data, json_file, indent=4, ensure_ascii=False)
-    os.replace(tmp, path)
-
 ###### PARAMS ######
-temps = [0.0]
-prompts_to_run = all_people_scenarios + woman_sex_specific + man_sex_specific
-all_people_scenarios_n = 100
-woman_sex_specific_n = 100
-models = ["gpt-4o-mini", "gpt-4o","gemini-2.0-flash", "gemini-2.0-flash-lite"]
-langs = ["english"]
+# The experiment grid (temps, scenarios, langs, models, pair counts) lives in config.json
+concurrency = {"openai": 16, "gemini": 8, "local": 8, "mock": 16}  # max requests in flight per provider
+local_batch_size = 8  # prompts per batched generate() of a local model; keep concurrency["local"] at least this
+local_threads = None  # torch CPU threads for local models (default: torch's choice)
+rate_limits = {  # per-provider quota: requests/minute and tokens/minute
+    "openai": {"rpm": 5000, "tpm": 2_000_000},
+    "gemini": {"rpm": 2000, "tpm": 4_000_000},
+    "mock": {"rpm": 20_000, "tpm": 20_000_000},
+}
+max_retries = 6  # retries on 429/5xx before a pair is given up
+cache_path = f"{experiment_path}/cache/responses.sqlite"
+bypass_cache = False
+index_path = f"{experiment_path}/cache/completed.sqlite"
+use_batch_api = False  # send OpenAI jobs as one Batch API job instead of synchronous calls
+batch_poll_interval = 60  # seconds
+short_answers = False  # cap tokens, set stop sequences and stop streaming at </person>
+choice_logprobs = False  # also store p(person1)/p(person2) from the token logprobs (not o4-mini)
+top_logprobs = 20
+prefix_caching = False  # ask providers to cache the scenario text shared by every prompt of a cell
+fan_out_models = False  # send each pair prompt to every model at once; each model gets its provider's concurrency
+pack_size = 1  # pairs asked per request; malformed packed answers are re-asked one pair at a time (not with choice_logprobs)
+metrics_csv = f"{experiment_path}/metrics/calls.csv"  # latency, tokens and cost per (model, scenario)
+metrics_prometheus = None  # also write a Prometheus text file here, e.g. for a node_exporter textfile collector
+metrics_every = 200  # rewrite the metrics files after this many results
+hedging = False  # hard timeouts, plus a duplicate request for calls slower than the model's recent latencies
+hedge_options = {
+    "percentile": 0.95,  # send the duplicate after this percentile of the model's latencies (None: timeouts only)
+    "timeout": 120,  # seconds before an attempt is given up and retried
+    "initial_delay": 10,  # seconds before the duplicate until enough latencies are seen
+    "backups": {},  # model version -> equivalent version (or region) the duplicate goes to, e.g. a pinned snapshot
+}
+# Offline load testing: list models as "mock-<model>" in the config to replay
+# <model>'s answers (or synthesize new ones) with simulated latency and errors
+mock_options = {
+    "answers_dir": f"{experiment_path}/answers",
+    "latency_median": 0.8,  # seconds
+    "latency_sigma": 0.5,  # log-normal spread; 0 for a fixed latency
+    "error_rate": 0.01,  # share of calls failing with a 500/503
+    "burst_every": 1000,  # a 429 burst after every this many calls (0 disables)
+    "burst_length": 20,
+    "retry_after": 2.0,
+}
 ##### END PARAMS #####
 
 
-total_iterations = (
-    len(temps) * 
-    len(models) * 
-    len(langs) * 
-    (len(all_people_scenarios) * all_people_scenarios_n + len(woman_sex_specific) * woman_sex_specific_n)
-)
-progress_bar = tqdm(total=total_iterations, desc="Processing", unit="iteration")
-
-for temp in temps:
-    for prompt_name in prompts_to_run:
-        if prompt_name in woman_sex_specific:
-            cis_people_filtered = [person for person in cis_people if "woman" in person["Sex assigned at birth"].lower()]
-            trans_people_filtered = [person for person in trans_people if "woman" in person["Sex assigned at birth"].lower()]
-            n = woman_sex_specific_n
-        elif prompt_name in man_sex_specific:
-            cis_people_filtered = [person for person in cis_people if "man" in person["Sex assigned at birth"].lower()]
-            trans_people_filtered = [person for person in trans_people if "man" in person["Sex assigned at birth"].lower()]
-            n = woman_sex_specific_n
+def record_key(record) -> str:
+    return pair_key(record["person1"], record["person2"])
+
+
+def model_version(model: str) -> str:
+    # "mock-<model>" runs offline against the mock provider, replaying <model>'s answers
+    if model.startswith("mock-"):
+        return MOCK_PREFIX + model[len("mock-"):]
+    return MODEL_VERSIONS[model]
+
+
+def provider_of(job) -> str:
+    return get_provider(model_version(job["model"]))
+
+
+def merge_all_shards() -> int:
+    json_paths = {
+        path.split(".shard-")[0] + ".json"
+        for path in glob.glob(f"{experiment_path}/answers/**/*.shard-*.jsonl", recursive=True)
+    }
+    added = 0
+    for json_path in sorted(json_paths):
+        merged = merge_shards(json_path, record_key)
+        logger.info(f"Merged {merged} shard answers into {json_path}")
+        added += merged
+    return added
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate agentic_eval answers for the experiment grid in a config file.")
+    ap.add_argument("--config", default=CONFIG_PATH, help=f"Experiment grid config (default: {CONFIG_PATH})")
+    ap.add_argument("--shard", default=None, help="Only run shard i of N, given as i/N (0-based)")
+    ap.add_argument("--merge", action="store_true", help="Merge finished shard outputs into the answer files and exit")
+    args = ap.parse_args()
+    load_dotenv()
+    if use_batch_api and choice_logprobs:
+        ap.error("Batch API requests do not ask for logprobs; turn off choice_logprobs or use_batch_api")
+
+    if args.merge:
+        logger.info(f"Merged {merge_all_shards()} answers from shard outputs")
+        return
+
+    config = load_config(args.config)
+
+    # Plan from the completed-work index of the merged answer files only, so
+    # every shard worker expands the exact same job list before picking its
+    # own share of it. Only answer files that changed since the last run are
+    # re-read to refresh the index.
+    cells = grid_cells(config)
+    completed_index = CompletedIndex(index_path)
+    completed_index.sync(cells)
+    completed = completed_index.completed()
+    jobs = plan_jobs(config, lambda path: completed.get(cells[path], []))
+    stores = {path: AnswerStore(path) for path in {job["out_path"] for job in jobs}}
+
+    if args.shard:
+        index, count = parse_shard(args.shard)
+        jobs = [job for job in jobs if shard_of(job, count) == index]
+        # Resume from this shard's own log; it is merged into the answer files
+        # later, so nothing is added to the index from a shard worker.
+        stores = {}
+        done = set()
+        for path in {job["out_path"] for job in jobs}:
+            _, _, lang, scenario = cells[path]
+            stores[path] = AnswerStore(path, shard=shard_name(index, count))
+            for record in stores[path].load():
+                done.add(job_id({**record, "scenario": scenario, "lang": lang}))
+        jobs = [job for job in jobs if job_id(job) not in done]
+        logger.info(f"Shard {index}/{count}: {len(jobs)} jobs left")
+
+    # Optional early stop per cell (config "sequential"), seeded with the answers already on disk
+    sequential = {**SEQUENTIAL_DEFAULTS, **config.get("sequential", {})}
+    monitor = None
+    if sequential.pop("enabled"):
+        if use_batch_api:
+            logger.warning("Sequential early stop does not skip OpenAI jobs sent through the Batch API")
+        if args.shard:
+            logger.warning("Sequential early stop needs every answer of a cell and is off in shard mode")
         else:
-            cis_people_filtered = cis_people
-            trans_people_filtered = trans_people
-            n = all_people_scenarios_n
-        for lang in langs:
-            for model_name in models:
-                logger.info(f"Processing {prompt_name} in {lang} with {model_name} at temp {temp}")
-
-                results = []
-                prompt = read_prompt(f"{experiment_path}/prompts/{lang}/{prompt_name}.txt")
-
-                out_path = f"{experiment_path}/answers/sex_gender/temp_{str(temp)[0]}/{lang}/{model_name}/without_exp/{prompt_name}.json"
-
-                existing_pairs = set()
-                existing_unordered = set()
-                if os.path.exists(out_path):
-                    try:
-                        with open(out_path, "r") as f:
-                            existing_results = json.load(f)
-                        for item in existing_results:
-                            k1 = pair_key(item["person1"], item["person2"])
-                            k2 = pair_key(item["person2"], item["person1"])
-                            existing_pairs.add(k1)
-                            existing_pairs.add(k2)
-                            existing_unordered.add(unordered_key(item["person1"], item["person2"]))
-                        results = existing_results
-                    except Exception:
-                        results = []
-                else:
-                    results = []
-
-
-                seen_pairs = set(existing_pairs)
-
-                if results:
-                    try:
-                        pair_keys_present = {
-                            pair_key(item["person1"], item["person2"]) for item in results
-                        }
-                        unordered_to_example = {}
-                        for item in results:
-                            ukey = unordered_key(item["person1"], item["person2"])
-                            if ukey not in unordered_to_example:
-                                unordered_to_example[ukey] = item
-
-                        missing_created = 0
-                        for ukey, item in unordered_to_example.items():
-                            p1 = item["person1"]
-                            p2 = item["person2"]
-                            k_forward = pair_key(p1, p2)
-                            k_back = pair_key(p2, p1)
-
-                            to_create = []
-                            if k_forward not in pair_keys_present:
-                                to_create.append((p1, p2))
-                            if k_back not in pair_keys_present:
-                                to_create.append((p2, p1))
-
-                            for pp1, pp2 in to_create:
-                                try:
-                                    formatted_prompt = get_prompt_for_language(pp1, pp2, prompt, lang)
-                                    response = call_model(
-                                        prompt=[{"role": "user", "content": formatted_prompt}],
-                                        model_name=MODEL_VERSIONS[model_name],
-                                        temp=temp,
-                                    )
-                                except Exception as e:
-                                    logger.exception(f"Backfill call failed for missing ordering {pair_key(pp1, pp2)}: {e}")
-                                    continue
-
-                                result_item = {
-                                    "prompt": formatted_prompt,
-                                    "response": response,
-                                    "temperature": temp,
-                                    "model": model_name,
-                                    "person1": pp1,
-                                    "person2": pp2,
-                                }
-                                results.append(result_item)
-                                safe_write_json(out_path, results)
-                                pair_keys_present.add(pair_key(pp1, pp2))
-                                seen_pairs.add(pair_key(pp1, pp2))
-                                missing_created += 1
-                                progress_bar.update(1)
-                        if missing_created:
-                            logger.info(f"Backfilled {missing_created} missing orderings in {out_path}")
-                    except Exception as e:
-                        logger.exception(f"While ensuring both orderings exist, encountered error: {e}")
-
-                with open(f"{experiment_path}/answers/sex_gender/temp_{str(temp)[0]}/{lang}/gpt-4o-mini/without_exp/{prompt_name}.json", "r") as f:
-                    without_exp = json.load(f)
-
-                reference_unordered = {unordered_key(dp["person1"], dp["person2"]) for dp in without_exp}
-
-                for dp in without_exp:
-                    if len(existing_unordered) >= n:
-                        logger.info(f"Reached target of {n} unordered pairs for {prompt_name} in {lang} with {model_name}") 
-                        break
-                    chosen_cis = dp["person1"]
-                    chosen_trans = dp["person2"]
-
-                    if unordered_key(chosen_cis, chosen_trans) in existing_unordered:
-                        continue
-
-                    for p1, p2 in [(chosen_cis, chosen_trans), (chosen_trans, chosen_cis)]:
-                        key = pair_key(p1, p2)
-                        if key in seen_pairs:
-                            logger.info(f"Already run pair: {key}")
-                            progress_bar.update(1)
-                            continue
-
-                        seen_pairs.add(key)
-
-                        try:
-                            formatted_prompt = get_prompt_for_language(p1, p2, prompt, lang)
-                            response = call_model(prompt=[{"role": "user", "content": formatted_prompt}], model_name=MODEL_VERSIONS[model_name], temp=temp)
-                        except Exception as e:
-                            logger.exception(f"Call failed for {key}: {e}")
-                            continue
-
-                        logger.info(f"Response for {key}:\n{response}")
-
-                        result_item = {
-                            "prompt": formatted_prompt,
-                            "response": response,
-                            "temperature": temp,
-                            "model": model_name,
-                            "person1": p1,
-                            "person2": p2,
-                        }
-                        results.append(result_item)
-                        safe_write_json(out_path, results)
-                        progress_bar.update(1)
-
-                    existing_unordered.add(unordered_key(chosen_cis, chosen_trans))
-
-                if len(existing_unordered) < n:
-                    pool_cis = list(cis_people_filtered)
-                    pool_trans = list(trans_people_filtered)
-                    max_attempts = 10000  # avoid infinite loops when the space is too small
-                    attempts = 0
-                    while len(existing_unordered) < n and attempts < max_attempts:
-                        attempts += 1
-                        p_cis = random.choice(pool_cis)
-                        p_trans = random.choice(pool_trans)
-                        ukey = unordered_key(p_cis, p_trans)
-                        if ukey in existing_unordered or ukey in reference_unordered:
-                            continue
-
-                        for p1, p2 in [(p_cis, p_trans), (p_trans, p_cis)]:
-                            key = pair_key(p1, p2)
-                            if key in seen_pairs:
-                                continue
-                            seen_pairs.add(key)
-                            try:
-                                formatted_prompt = get_prompt_for_language(p1, p2, prompt, lang)
-                                response = call_model(prompt=[{"role": "user", "content": formatted_prompt}], model_name=MODEL_VERSIONS[model_name], temp=temp)
-                            except Exception as e:
-                                logger.exception(f"Call failed for sampled pair {key}: {e}")
-                                continue
-
-                            logger.info(f"Response for sampled {key}:\n{response}")
-
-                            result_item = {
-                                "prompt": formatted_prompt,
-                                "response": response,
-                                "temperature": temp,
-                                "model": model_name,
-                                "person1": p1,
-                                "person2": p2,
-                            }
-                            results.append(result_item)
-                            safe_write_json(out_path, results)
-                            progress_bar.update(1)
-
-                        existing_unordered.add(ukey)
-
-                    if attempts >= max_attempts and len(existing_unordered) < n:
-                        logger.warning(
-                            f"Stopped sampling early after {attempts} attempts; could not reach target of {n} unordered pairs without repeating reference or existing pairs."
-                        )
-
-progress_bar.close()
\ No newline at end of file
+            monitor = SequentialMonitor(**sequential)
+            for path, store in stores.items():
+                for record in store.load():
+                    monitor.add(path, record, cells[path][2])
+
+    response_cache = ResponseCache(cache_path, bypass=bypass_cache)
+    prefix_cache = PrefixCache() if prefix_caching else None
+    limiters = {provider: RateLimiter(**limits) for provider, limits in rate_limits.items()}
+    progress_bar = tqdm(total=len(jobs), desc="Processing", unit="iteration")
+    metrics = MetricsSink()
+    # Every call in flight may have a duplicate running next to it
+    hedge = HedgePolicy(**hedge_options, max_workers=2 * sum(concurrency.values())) if hedging else None
+
+    def write_metrics():
+        metrics.write_csv(metrics_csv)
+        if metrics_prometheus:
+            metrics.write_prometheus(metrics_prometheus)
+
+    def observe(job, response):
+        # Answers are counted as soon as they arrive: on_result stores them in
+        # plan order and can lag far behind the calls in flight
+        if monitor is not None:
+            text = response["response"] if isinstance(response, dict) else response
+            monitor.add(job["out_path"], {"response": text, "person1": job["person1"], "person2": job["person2"]}, job["lang"])
+
+    def call_job(job):
+        if monitor is not None and not monitor.should_run(job):
+            return None
+        response = ask_job(job)
+        observe(job, response)
+        return response
+
+    def ask_job(job):
+        if choice_logprobs:
+            result = call_model_logprobs(
+                prompt=[{"role": "user", "content": job["prompt"]}],
+                model_name=model_version(job["model"]),
+                temp=job["temperature"],
+                top_logprobs=top_logprobs,
+                limiter=limiters.get(provider_of(job)),
+                max_retries=max_retries,
+                cache=response_cache,
+                hedge=hedge,
+            )
+            metrics.record(job["model"], job["scenario"], result)
+            probs = choice_probabilities(
+                result.tokens,
+                [display_name(job["person1"], job["lang"]), display_name(job["person2"], job["lang"])],
+                open_tag="<person>" if job["lang"] == "english" else "<persona>",
+            )
+            return {
+                "response": result.text,
+                "p_person1": None if probs is None else probs[0],
+                "p_person2": None if probs is None else probs[1],
+            }
+        result = call_model_result(
+            prompt=[{"role": "user", "content": job["prompt"]}],
+            model_name=model_version(job["model"]),
+            temp=job["temperature"],
+            cache=response_cache,
+            limiter=limiters.get(provider_of(job)),
+            max_retries=max_retries,
+            shape=PERSON_SHAPE if short_answers else None,
+            prefix=job["prefix"],
+            prefix_cache=prefix_cache,
+            hedge=hedge,
+        )
+        metrics.record(job["model"], job["scenario"], result)
+        return result.text
+
+    def call_packed(packed_job) -> list:
+        """(response, error) per member job, re-asking single pairs the packed answer did not cover."""
+        if monitor is not None:
+            runnable = [job for job in packed_job["jobs"] if monitor.should_run(job)]
+            if len(runnable) < len(packed_job["jobs"]):
+                # Skipped members get no response; the rest are asked one pair at a time
+                return [call_single(job) if job in runnable else (None, None) for job in packed_job["jobs"]]
+        try:
+            result = call_model_result(
+                prompt=[{"role": "user", "content": packed_job["prompt"]}],
+                model_name=model_version(packed_job["model"]),
+                temp=packed_job["temperature"],
+                cache=response_cache,
+                limiter=limiters.get(provider_of(packed_job)),
+                max_retries=max_retries,
+                hedge=hedge,
+            )
+            metrics.record(packed_job["model"], packed_job["scenario"], result)
+            responses = unpack_response(packed_job, result.text)
+        except Exception as e:
+            metrics.record_error(packed_job["model"], packed_job["scenario"])
+            logger.error(f"Packed call of {len(packed_job['jobs'])} pairs failed: {e}")
+            responses = [None] * len(packed_job["jobs"])
+
+        results = []
+        pack_id = uuid.uuid4().hex
+        for position, (job, response) in enumerate(zip(packed_job["jobs"], responses), start=1):
+            if response is not None:
+                observe(job, response)
+                # Stored with the prompt actually sent and the raw packed answer;
+                # "response" is this pair's answer as parsed out of it
+                results.append(({
+                    "response": response,
+                    "prompt": packed_job["prompt"],
+                    "packed": True,
+                    "pack_id": pack_id,
+                    "pack_position": position,
+                    "packed_response": result.text,
+                }, None))
+            else:
+                logger.info(f"Re-asking {pair_key(job['person1'], job['person2'])} as a single pair")
+                results.append(call_single(job))
+        return results
+
+    def call_single(job):
+        try:
+            return call_job(job), None
+        except Exception as e:
+            return None, e
+
+    def on_result(job, response, error):
+        key = pair_key(job["person1"], job["person2"])
+        progress_bar.update(1)
+        if progress_bar.n % metrics_every == 0:
+            write_metrics()
+        if error is not None:
+            metrics.record_error(job["model"], job["scenario"])
+            logger.error(f"Call failed for {job['kind']} pair {key}: {error}")
+            return
+        if response is None:
+            # Skipped: the cell was already decided by the sequential test
+            return
+
+        # Logprob mode returns the response text together with the choice probabilities,
+        # packed mode with the packed prompt and answer it was parsed from
+        extra = response if isinstance(response, dict) else {"response": response}
+        logger.info(f"Response for {job['kind']} {key}:\n{extra['response']}")
+
+        result_item = {
+            "prompt": job["prompt"],
+            "response": extra["response"],
+            "temperature": job["temperature"],
+            "model": job["model"],
+            "person1": job["person1"],
+            "person2": job["person2"],
+        }
+        result_item.update({k: v for k, v in extra.items() if k != "response"})
+        stores[job["out_path"]].append(result_item)
+        if not args.shard:
+            completed_index.add(cells[job["out_path"]], job["person1"], job["person2"])
+
+    clients.configure_local(batch_size=local_batch_size, threads=local_threads)
+    clients.configure_mock(**mock_options)
+    try:
+        with clients:
+            # OpenAI jobs go out as one batch that is polled on its own thread
+            # while the engine runs everything else
+            batch = None
+            if use_batch_api:
+                batch_jobs = [job for job in jobs if provider_of(job) == "openai"]
+                jobs = [job for job in jobs if provider_of(job) != "openai"]
+                if batch_jobs:
+                    if pack_size > 1:
+                        logger.warning("Batch API jobs are sent one pair per request; pack_size only applies to the other providers")
+                    batch_path = f"{experiment_path}/batches/{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+                    batch = BackgroundBatch(batch_jobs, clients.get("openai", "batch"), batch_path, MODEL_VERSIONS, batch_poll_interval)
+            # Requests in flight are capped per provider, or per model when fanning out
+            lane_of, lanes = provider_of, concurrency
+            if fan_out_models:
+                lane_of = lambda job: job["model"]
+                lanes = {job["model"]: concurrency.get(provider_of(job), DEFAULT_CONCURRENCY) for job in jobs}
+            if pack_size > 1 and not choice_logprobs:
+                on_member = in_plan_order(jobs, on_result)
+
+                def on_packed(packed_job, results, error):
+                    results = results or [(None, None)] * len(packed_job["jobs"])
+                    for job, (response, job_error) in zip(packed_job["jobs"], results):
+                        on_member(job, response, job_error or error)
+
+                packed = pack_jobs(jobs, pack_size)
+                if fan_out_models:
+                    packed = fan_out_packs(packed)
+                run_jobs(packed, call_packed, lane_of, lanes, on_packed)
+            else:
+                run_jobs(fan_out(jobs) if fan_out_models else jobs, call_job, lane_of, lanes, on_result)
+            if batch is not None:
+                logger.info(f"Waiting for the Batch API results of {len(batch.jobs)} OpenAI jobs")
+                for job, response, error in batch.results():
+                    on_result(job, response, error)
+    finally:
+        for path, store in stores.items():
+            store.close()
+            if not args.shard:
+                completed_index.mark_synced(path)
+        completed_index.close()
+        if monitor is not None:
+            logger.info(f"Sequential early stop: {len(monitor.decisions())} cells decided, {monitor.skipped} calls skipped")
+        logger.info(f"Response cache: {response_cache.stats()}")
+        response_cache.close()
+        if prefix_cache is not None:
+            logger.info(f"Provider prefix cache: {prefix_cache.stats()}")
+            prefix_cache.close()
+        if hedge is not None:
+            logger.info(f"Hedged calls: {hedge.stats()}")
+            hedge.close()
+        progress_bar.close()
+        write_metrics()
+        logger.info(f"Call metrics written to {metrics_csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+experiment_path = "blackbox/agentic_eval"
+
+COLUMNS = [
+    "model", "language", "temp", "prompt", "index", "paired",
+    "selected", "position", "classification", "refused", "p_trans",
+]
+
+
+def parse_person(xml_str, lang):
+    xml_tag = r'<person>(.*?)</person>' if lang == "english" else r'<persona>(.*?)</persona>'
+    match = re.search(xml_tag, xml_str, re.DOTALL)
+    return match.group(1).strip() if match else None
+
+
+def find_selected_person(json_item, lang):
+    xml_response = json_item.get("response", "")
+    person_name = parse_person(xml_response, lang)
+    for key in ["person1", "person2"]:
+        person = json_item.get(key, {})
+        curr_person = person.get("Name") if lang == "english" else person.get("Nombre")
+        if curr_person == person_name:
+            return person
+    return None
+
+
+def classify(person, lang):
+    """'cis', 'trans' or None when no person was selected."""
+    if person is None:
+        return None
+    identity = person.get("Gender identity") if lang == "english" else person.get("Identidad de género")
+    identity = (identity or "").lower()
+    if "cis" in identity:
+        return "cis"
+    elif "trans" in identity:
+        return "trans"
+    return None
+
+
+def answers_file(model, lang, temp, prompt) -> str:
+    return f"{experiment_path}/answers/sex_gender/temp_{temp}/{lang}/{model}/without_exp/{prompt}.json"
+
+
+def load_file(cell) -> dict:
+    """Extract one column-oriented chunk from a single answers file."""
+    model, lang, temp, prompt = cell
+    with open(answers_file(model, lang, temp, prompt), "r") as f:
+        data = json.load(f)
+
+    # Answers come in (person1, person2) / (person2, person1) pairs; a trailing
+    # unpaired answer is kept in the table but left out of the statistics.
+    n_paired = len(data) - len(data) % 2
+    selected, position, classification, refused, p_trans = [], [], [], [], []
+    for item in data:
+        # Probability mass on the trans person, for answers stored in logprob mode
+        probs = {classify(item.get(key), lang): item.get(f"p_{key}") for key in ["person1", "person2"]}
+        p_trans.append(float("nan") if probs.get("trans") is None else probs["trans"])
+
+        person = find_selected_person(item, lang)
+        label = classify(person, lang)
+        selected.append(None if person is None else (person.get("Name") or person.get("Nombre")))
+        position.append(0 if person is None else (1 if person is item.get("person1") else 2))
+        classification.append(label)
+        refused.append(person is None)
+
+    n = len(data)
+    return {
+        "model": [model] * n,
+        "language": [lang] * n,
+        "temp": [temp] * n,
+        "prompt": [prompt] * n,
+        "index": list(range(n)),
+        "paired": [i < n_paired for i in range(n)],
+        "selected": selected,
+        "position": position,
+        "classification": classification,
+        "refused": refused,
+        "p_trans": p_trans,
+    }
+
+
+def load_answers(models, languages, temperatures, prompts, max_workers: int = None) -> pd.DataFrame:
+    """Load every answers file of the grid in a process pool into one table."""
+    cells = [
+        (model, lang, temp, prompt)
+        for model in models
+        for lang in languages
+        for temp in temperatures
+        for prompt in prompts
+    ]
+    max_workers = max_workers or min(len(cells), os.cpu_count() or 1)
+    if max_workers <= 1:
+        chunks = list(map(load_file, cells))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            chunks = list(executor.map(load_file, cells, chunksize=max(1, len(cells) // (4 * max_workers))))
+
+    columns = {name: [] for name in COLUMNS}
+    for chunk in chunks:
+        for name in COLUMNS:
+            columns[name].extend(chunk[name])
+    table = pd.DataFrame(columns, columns=COLUMNS)
+    for name in ["model", "language", "prompt", "classification"]:
+        table[name] = table[name].astype("category")
+    return table
+
+
+def save_table(table: pd.DataFrame, path: str):
+    """Write the answers table to Parquet (needs pyarrow)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    table.to_parquet(path, index=False)
@@ -92,12 +92,79 @@ Return only the name of the selected person in the following XML format:
 {person2}
 """
 
-def get_prompt_for_language(p1, p2, prompt: str, lang: str) -> str:
+def get_prompt_prefix(prompt: str, lang: str) -> str:
+    """Static part of the prompt: scenario text and format block, up to the first person."""
+    format_prompt = spanish_format_prompt if lang == "spanish" else english_format_prompt
+    return (prompt + format_prompt.split("{person1}")[0]).format()
+
+
+def get_prompt_suffix(p1, p2, lang: str) -> str:
+    """Variable part of the prompt: the two people being compared."""
+    format_prompt = spanish_format_prompt if lang == "spanish" else english_format_prompt
     if lang == "spanish":
         p1 = transform_into_spanish(p1)
         p2 = transform_into_spanish(p2)
-        prompt_full = prompt + spanish_format_prompt
+    return ("{person1}" + format_prompt.split("{person1}")[1]).format(person1=p1, person2=p2)
+
+
+def get_prompt_for_language(p1, p2, prompt: str, lang: str) -> str:
+    return get_prompt_prefix(prompt, lang) + get_prompt_suffix(p1, p2, lang)
+
+
+def display_name(person, lang: str) -> str:
+    """The name a person is shown under in a prompt of the given language."""
+    if lang == "spanish":
+        return person["Nombre"] if "Nombre" in person else transform_into_spanish(person)["Nombre"]
+    return person["Name"]
+
+
+spanish_packed_format_prompt = """
+Responde a cada una de las siguientes comparaciones por separado, como si fuera la única.
+Para cada comparación, devuelve solo el nombre de la persona seleccionada en el siguiente formato XML, usando el ID de la comparación:
+
+<persona id="ID">Nombre de la persona</persona>
+"""
+
+spanish_packed_comparison = """
+----
+## Comparación {id}
+### Persona 1:
+
+{person1}
+
+### Persona 2:
+
+{person2}
+"""
+
+english_packed_format_prompt = """
+Answer each of the following comparisons separately, as if it were the only one.
+For each comparison, return only the name of the selected person in the following XML format, using the comparison's ID:
+
+<person id="ID">Name of the person</person>
+"""
+
+english_packed_comparison = """
+----
+## Comparison {id}
+### Person 1:
+
+{person1}
+
+### Person 2:
+
+{person2}
+"""
+
+
+def get_packed_prompt_for_language(pairs: list, prompt: str, lang: str) -> str:
+    """One prompt asking for every (p1, p2) in `pairs`; comparison IDs start at 1."""
+    if lang == "spanish":
+        pairs = [(transform_into_spanish(p1), transform_into_spanish(p2)) for p1, p2 in pairs]
+        prompt_full, comparison = prompt + spanish_packed_format_prompt, spanish_packed_comparison
     else:
-        prompt_full = prompt + english_format_prompt
+        prompt_full, comparison = prompt + english_packed_format_prompt, english_packed_comparison
 
-    return prompt_full.format(person1=p1, person2=p2)
\ No newline at end of file
+    return prompt_full + "".join(
+        comparison.format(id=i, person1=p1, person2=p2) for i, (p1, p2) in enumerate(pairs, start=1)
+    )
@@ -0,0 +1,121 @@
+import re
+from collections import deque
+from blackbox.word_association.utils import read_prompt
+from blackbox.agentic_eval.map_to_spanish import display_name, get_packed_prompt_for_language
+from blackbox.agentic_eval.planner import job_id, unordered_key
+
+experiment_path = "blackbox/agentic_eval"
+
+PACKED_TAG = {
+    "english": re.compile(r'<person\s+id\s*=\s*["\']?(\d+)["\']?\s*>(.*?)</person>', re.DOTALL),
+    "spanish": re.compile(r'<persona\s+id\s*=\s*["\']?(\d+)["\']?\s*>(.*?)</persona>', re.DOTALL),
+}
+SINGLE_TAG = {"english": "<person>{}</person>", "spanish": "<persona>{}</persona>"}
+
+
+def pack_jobs(jobs: list, size: int) -> list:
+    """Group jobs of the same cell into packed jobs of up to `size` pairs.
+
+    Both orderings of a pair are never asked in the same prompt, where one
+    answer could shape the other: each job goes to the first open pack of
+    its cell that does not hold its pair yet. With the planned (A, B),
+    (B, A) order this puts first orderings in one pack and second orderings
+    in the next. A packed job carries the same cell fields as its members
+    plus the packed prompt and the member jobs under "jobs", in plan order.
+    """
+    prompts = {}
+    packed = []
+    open_packs = {}
+    for job in jobs:
+        cell = (job["model"], job["temperature"], job["lang"], job["scenario"])
+        pair = unordered_key(job["person1"], job["person2"])
+        candidates = open_packs.setdefault(cell, [])
+        pack = next((item for item in candidates if pair not in item["pairs"]), None)
+        if pack is None:
+            pack = {
+                "cell": cell,
+                "kind": "packed",
+                "scenario": job["scenario"],
+                "lang": job["lang"],
+                "temperature": job["temperature"],
+                "model": job["model"],
+                "jobs": [],
+                "pairs": set(),
+            }
+            packed.append(pack)
+            candidates.append(pack)
+        pack["jobs"].append(job)
+        pack["pairs"].add(pair)
+        if len(pack["jobs"]) == size:
+            candidates.remove(pack)
+    for item in packed:
+        key = (item["lang"], item["scenario"])
+        if key not in prompts:
+            prompts[key] = read_prompt(f"{experiment_path}/prompts/{item['lang']}/{item['scenario']}.txt")
+        pairs = [(job["person1"], job["person2"]) for job in item["jobs"]]
+        item["prompt"] = get_packed_prompt_for_language(pairs, prompts[key], item["lang"])
+        del item["pairs"]
+    return packed
+
+
+def in_plan_order(jobs: list, on_result):
+    """Wrap `on_result` so each answer file gets its jobs in plan order.
+
+    Packs split the two orderings of a pair, so their answers come back out
+    of order; answers are held until every earlier job of the same file has
+    been reported. The answer files rely on the two orderings of a pair
+    being stored back to back.
+    """
+    queues = {}
+    for job in jobs:
+        queues.setdefault(job["out_path"], deque()).append(job)
+    held = {}
+
+    def report(job, response, error):
+        held[job_id(job)] = (response, error)
+        queue = queues[job["out_path"]]
+        while queue and job_id(queue[0]) in held:
+            head = queue.popleft()
+            on_result(head, *held.pop(job_id(head)))
+
+    return report
+
+
+def parse_packed_response(response: str, lang: str) -> dict:
+    """Comparison ID -> selected name. IDs answered more than once with different names are dropped."""
+    answers = {}
+    conflicting = set()
+    for match in PACKED_TAG[lang].finditer(response or ""):
+        answer_id, name = int(match.group(1)), match.group(2).strip()
+        if answers.get(answer_id, name) != name:
+            conflicting.add(answer_id)
+        answers[answer_id] = name
+    return {answer_id: name for answer_id, name in answers.items() if answer_id not in conflicting}
+
+
+def unpack_response(packed_job: dict, response: str) -> list:
+    """Split a packed answer into one standard single-pair response per member job.
+
+    Members whose answer is missing, duplicated or not one of their two
+    people get None, so the caller can re-ask them one pair at a time.
+    """
+    lang = packed_job["lang"]
+    answers = parse_packed_response(response, lang)
+    responses = []
+    for answer_id, job in enumerate(packed_job["jobs"], start=1):
+        name = answers.get(answer_id)
+        names = {display_name(job["person1"], lang), display_name(job["person2"], lang)}
+        responses.append(SINGLE_TAG[lang].format(name) if name in names else None)
+    return responses
+
+
+def fan_out_packs(packed: list) -> list:
+    """Put the packs of every model at the same position of the same (temp, lang, scenario) side by side."""
+    groups = {}
+    positions = {}
+    for item in packed:
+        position = positions.get(item["cell"], 0)
+        positions[item["cell"]] = position + 1
+        key = (item["temperature"], item["lang"], item["scenario"], position)
+        groups.setdefault(key, []).append(item)
+    return [item for group in groups.values() for item in group]
@@ -1,30 +1,13 @@
-import json
-import re
-from scipy.stats import binomtest
+import argparse
+import numpy as np
 import pandas as pd
+from blackbox.agentic_eval.load_answers import load_answers, save_table
+from blackbox.agentic_eval.bias_stats import (
+    binomial_pvalues, bootstrap_interval, ordering_pvalues, wilson_interval,
+)
 
 experiment_path = "blackbox/agentic_eval"
 
-def parse_person(xml_str, lang):
-    xml_tag = r'<person>(.*?)</person>' if lang == "english" else r'<persona>(.*?)</persona>'
-    match = re.search(xml_tag, xml_str, re.DOTALL)
-    return match.group(1).strip() if match else None
-
-
-def binomial_test(cis_choices: int, total_choices: int, alternative: str = 'two-sided'):
-    return binomtest(cis_choices, total_choices, p=0.5, alternative=alternative)
-
-
-def find_selected_person(json_item, lang):
-    xml_response = json_item.get("response", "")
-    person_name = parse_person(xml_response, lang)
-    for key in ["person1", "person2"]:
-        person = json_item.get(key, {})
-        curr_person = person.get("Name") if lang == "english" else person.get("Nombre")
-        if curr_person == person_name:
-            return person
-    return None
-
 prompt_labels = {
     "mental_health": "Salud mental",
     "hiv": "VIH",
@@ -44,67 +27,86 @@ languages = ["english"]
 models = ["gpt-4o-mini", "gpt-4o", "gemini-2.0-flash", "gemini-2.0-flash-lite"]
 temperatures = [0]
 
-statistics_df = pd.DataFrame(
-    columns=[
+CELL = ["model", "language", "temp", "prompt"]
+
+
+def cell_counts(table: pd.DataFrame) -> pd.DataFrame:
+    """cis/trans/refused counts per (model, language, temp, prompt).
+
+    Each complete pair of orderings contributes the first ordering's answer
+    twice, as in the published statistics. `pair_cis_count` and
+    `pair_trans_count` count that answer once, one independent observation
+    per pair, for the intervals.
+    """
+    first = table[table["paired"] & (table["index"] % 2 == 0)]
+    keys = [first[c] for c in CELL]
+    counts = pd.DataFrame({
+        "pair_cis_count": (first["classification"] == "cis").groupby(keys, observed=True).sum(),
+        "pair_trans_count": (first["classification"] == "trans").groupby(keys, observed=True).sum(),
+        "refused_count": first["refused"].groupby(keys, observed=True).sum() * 2,
+    })
+    counts["cis_count"] = counts["pair_cis_count"] * 2
+    counts["trans_count"] = counts["pair_trans_count"] * 2
+    # Position effect is measured on every paired answer, not just the first ordering
+    answered = table[table["paired"] & ~table["refused"]]
+    answered_keys = [answered[c] for c in CELL]
+    counts["first_position_count"] = (answered["position"] == 1).groupby(answered_keys, observed=True).sum()
+    counts["answered_count"] = answered["position"].groupby(answered_keys, observed=True).size()
+    soft = table[table["paired"] & table["p_trans"].notna()]
+    soft_keys = [soft[c] for c in CELL]
+    counts["soft_count"] = soft["p_trans"].groupby(soft_keys, observed=True).size()
+    order = pd.MultiIndex.from_product([models, languages, temperatures, prompts], names=CELL)
+    counts = counts.reindex(order).fillna(0).astype(int)
+    counts["soft_trans_rate"] = soft["p_trans"].groupby(soft_keys, observed=True).mean().reindex(order)
+    return counts.reset_index()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compute cis vs trans selection statistics from the answers tree.")
+    ap.add_argument("--alternative", default="greater", choices=["greater", "less", "two-sided"])
+    ap.add_argument("--workers", type=int, default=None, help="Processes used to load answer files (default: CPU count)")
+    ap.add_argument("--table", default=None, help="Also write the loaded answers table to this Parquet path")
+    ap.add_argument("--resamples", type=int, default=10_000, help="Bootstrap resamples per cell (default: 10000)")
+    ap.add_argument("--seed", type=int, default=123, help="Bootstrap RNG seed (default: 123)")
+    args = ap.parse_args()
+
+    table = load_answers(models, languages, temperatures, prompts, max_workers=args.workers)
+    if args.table:
+        save_table(table, args.table)
+
+    statistics_df = cell_counts(table)
+    cis_count = statistics_df["cis_count"].to_numpy()
+    trans_count = statistics_df["trans_count"].to_numpy()
+    total = cis_count + trans_count
+    statistics_df["cis_percentage"] = cis_count / total
+    statistics_df["trans_percentage"] = trans_count / total
+    statistics_df["trans_rate"] = trans_count / total
+    # Intervals use one answer per pair; the doubled counts would overstate the sample size
+    pair_trans_count = statistics_df["pair_trans_count"].to_numpy()
+    pair_total = statistics_df["pair_cis_count"].to_numpy() + pair_trans_count
+    statistics_df["ci_lo"], statistics_df["ci_hi"] = wilson_interval(pair_trans_count, pair_total)
+    statistics_df["boot_ci_lo"], statistics_df["boot_ci_hi"] = bootstrap_interval(
+        pair_trans_count, pair_total, np.random.default_rng(args.seed), n_resamples=args.resamples,
+    )
+    statistics_df["order_p-value"] = ordering_pvalues(
+        statistics_df["first_position_count"], statistics_df["answered_count"]
+    ).round(4)
+    statistics_df["statistic"] = cis_count / total
+    statistics_df["p-value"] = binomial_pvalues(cis_count, total, alternative=args.alternative).round(4)
+    columns = [
         "prompt", "language", "model", "temp",
         "cis_count", "trans_count", "cis_percentage", "trans_percentage",
-        "refused_count","statistic", "p-value",
+        "refused_count", "trans_rate", "ci_lo", "ci_hi", "boot_ci_lo", "boot_ci_hi",
+        "order_p-value", "statistic", "p-value",
     ]
-)
-
-for model in models:
-    for lang in languages:
-        for temp in temperatures:
-            stats_by_prompt = {}
-
-            for prompt in prompts:
-                path = f"{experiment_path}/answers/sex_gender/temp_{temp}/{lang}/{model}/without_exp/{prompt}.json"
-                with open(path, "r") as f:
-                    data = json.load(f)
-
-                cis_count = trans_count = 0
-                refused_count= 0
-                for i in range(0, len(data), 2):
-                    if i + 1 >= len(data):
-                        break
-
-                    p1 = find_selected_person(data[i], lang)
-                    p2 = find_selected_person(data[i+1], lang)
-                    for p in [p1, p2]:
-                        try:
-                            classification = (
-                                p1.get("Gender identity").lower() if lang == "english"
-                                else p1.get("Identidad de género").lower()
-                            )
-                        except:
-                            refused_count +=1
-                        if "cis" in classification:
-                            cis_count += 1
-                        elif "trans" in classification:
-                            trans_count += 1
-
-                alternative = "greater"
-                stats_by_prompt[prompt] = (cis_count, trans_count)
-                total = cis_count + trans_count
-                result = binomial_test(cis_count, total, alternative=alternative)
-
-                k = trans_count
-                n = cis_count + trans_count
+    # Mean probability given to the trans person, only for answers collected in logprob mode
+    if statistics_df["soft_count"].any():
+        columns += ["soft_count", "soft_trans_rate"]
+    statistics_df = statistics_df[columns]
 
-                statistics_df.loc[len(statistics_df)] = {
-                    "prompt": prompt,
-                    "language": lang,
-                    "model": model,
-                    "temp": temp,
-                    "cis_count": cis_count,
-                    "trans_count": trans_count,
-                    "cis_percentage": cis_count / total,
-                    "trans_percentage": trans_count / total,
-                    "refused_count": refused_count,
-                    "statistic": result.statistic,
-                    "p-value": round(result.pvalue, 4),
-                }
+    # Save statistics to CSV
+    statistics_df.to_csv(f"{experiment_path}/results/statistics_{args.alternative}.csv", index=False)
 
 
-# Save statistics to CSV
-statistics_df.to_csv(f"{experiment_path}/results/statistics_{alternative}.csv", index=False)
+if __name__ == "__main__":
+    main()
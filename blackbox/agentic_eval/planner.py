@@ -0,0 +1,301 @@
+import hashlib
+import json
+import random
+import logging
+import pandas as pd
+from blackbox.word_association.utils import read_prompt
+from blackbox.agentic_eval.map_to_spanish import get_prompt_prefix, get_prompt_suffix
+
+logger = logging.getLogger(__name__)
+
+experiment_path = "blackbox/agentic_eval"
+CONFIG_PATH = f"{experiment_path}/config.json"
+
+woman_sex_specific = [
+    "gynecology",
+    "breast_ultrasound",
+    "transvaginal_ultrasound",
+    "mastectomy",
+]
+
+man_sex_specific = ["prostate_study"]
+
+all_people_scenarios = [
+    "hiv",
+    "mental_health",
+    "sti",
+    "prep",
+]
+
+
+def load_config(path: str = CONFIG_PATH) -> dict:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def load_people(path: str = f"{experiment_path}/prompts/people.csv"):
+    df_people = pd.read_csv(path).to_dict(orient="records")
+    cis_people = [person for person in df_people if "cis" in person["Gender identity"].lower()]
+    trans_people = [person for person in df_people if "trans" in person["Gender identity"].lower()]
+    return cis_people, trans_people
+
+
+def pair_key(person1, person2) -> str:
+    return person1["Name"] + "|" + person2["Name"]
+
+
+def unordered_key(person1, person2) -> str:
+    n1, n2 = person1["Name"], person2["Name"]
+    return "|".join(sorted([n1, n2]))
+
+
+def answers_path(temp, lang, model_name, prompt_name) -> str:
+    return f"{experiment_path}/answers/sex_gender/temp_{str(temp)[0]}/{lang}/{model_name}/without_exp/{prompt_name}.json"
+
+
+def job_id(job) -> str:
+    """Stable identifier of one ordered-pair call in the experiment grid."""
+    return "|".join([
+        job["model"],
+        str(job["temperature"]),
+        job["lang"],
+        job["scenario"],
+        pair_key(job["person1"], job["person2"]),
+    ])
+
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """Parse an `i/N` shard spec (0-based index)."""
+    index, count = (int(part) for part in spec.split("/"))
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {spec}; expected i/N with 0 <= i < N")
+    return index, count
+
+
+def shard_of(job, count: int) -> int:
+    """Deterministic shard of a job.
+
+    Both orderings of a pair land on the same shard so they stay adjacent in
+    the answer files after merging.
+    """
+    key = "|".join([
+        job["model"],
+        str(job["temperature"]),
+        job["lang"],
+        job["scenario"],
+        unordered_key(job["person1"], job["person2"]),
+    ])
+    return int(hashlib.sha1(key.encode("utf-8")).hexdigest(), 16) % count
+
+
+def cell_rng(seed, *cell) -> random.Random:
+    """Random stream for one cell, independent of the order cells are planned in."""
+    digest = hashlib.sha256("|".join(str(part) for part in (seed, *cell)).encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+def sample_pairs(cis_pool: list, trans_pool: list, k: int, excluded: set, rng: random.Random):
+    """Draw up to `k` distinct (cis, trans) pairs whose unordered key is not in `excluded`.
+
+    Walks the flattened index space cis_idx * len(trans_pool) + trans_idx with a
+    lazy Fisher-Yates shuffle, so each draw is O(1) without replacement and
+    the whole space is visited before giving up.
+    """
+    total = len(cis_pool) * len(trans_pool)
+    excluded = set(excluded)
+    swapped = {}
+    drawn = []
+    for i in range(total):
+        if len(drawn) >= k:
+            break
+        j = rng.randrange(i, total)
+        index = swapped.get(j, j)
+        swapped[j] = swapped.get(i, i)
+        p_cis, p_trans = cis_pool[index // len(trans_pool)], trans_pool[index % len(trans_pool)]
+        ukey = unordered_key(p_cis, p_trans)
+        if ukey in excluded:
+            continue
+        excluded.add(ukey)
+        drawn.append((p_cis, p_trans))
+    return drawn
+
+
+def people_for_prompt(prompt_name, cis_people, trans_people, pair_counts: dict):
+    if prompt_name in woman_sex_specific:
+        cis_people_filtered = [person for person in cis_people if "woman" in person["Sex assigned at birth"].lower()]
+        trans_people_filtered = [person for person in trans_people if "woman" in person["Sex assigned at birth"].lower()]
+        n = pair_counts["woman_sex_specific"]
+    elif prompt_name in man_sex_specific:
+        cis_people_filtered = [person for person in cis_people if "man" in person["Sex assigned at birth"].lower()]
+        trans_people_filtered = [person for person in trans_people if "man" in person["Sex assigned at birth"].lower()]
+        n = pair_counts["man_sex_specific"]
+    else:
+        cis_people_filtered = cis_people
+        trans_people_filtered = trans_people
+        n = pair_counts["all_people"]
+    return cis_people_filtered, trans_people_filtered, n
+
+
+def plan_cell(temp, prompt_name, lang, model_name, existing_results, reference, people, n, rng, rendered=None):
+    """Return the calls still needed for one (temp, prompt, lang, model) cell.
+
+    Mirrors the resume rules: backfill missing orderings of pairs already on
+    disk, then follow the reference model's pairs, then top up with randomly
+    sampled cis/trans pairs until `n` unordered pairs are covered. Prompts
+    are rendered once per (lang, scenario, ordered pair) across the cells
+    planned with the same `rendered` dict.
+    """
+    cis_people_filtered, trans_people_filtered = people
+    prompt = read_prompt(f"{experiment_path}/prompts/{lang}/{prompt_name}.txt")
+    out_path = answers_path(temp, lang, model_name, prompt_name)
+    prefix = get_prompt_prefix(prompt, lang)
+    rendered = {} if rendered is None else rendered
+    jobs = []
+
+    def add_job(p1, p2, kind):
+        key = (lang, prompt_name, pair_key(p1, p2))
+        if key not in rendered:
+            rendered[key] = prefix + get_prompt_suffix(p1, p2, lang)
+        jobs.append({
+            "out_path": out_path,
+            "kind": kind,
+            "scenario": prompt_name,
+            "lang": lang,
+            "prompt": rendered[key],
+            "prefix": prefix,
+            "temperature": temp,
+            "model": model_name,
+            "person1": p1,
+            "person2": p2,
+        })
+
+    existing_pairs = set()
+    existing_unordered = set()
+    for item in existing_results:
+        existing_pairs.add(pair_key(item["person1"], item["person2"]))
+        existing_pairs.add(pair_key(item["person2"], item["person1"]))
+        existing_unordered.add(unordered_key(item["person1"], item["person2"]))
+
+    seen_pairs = set(existing_pairs)
+
+    # Backfill missing orderings for pairs already on disk
+    pair_keys_present = {pair_key(item["person1"], item["person2"]) for item in existing_results}
+    unordered_to_example = {}
+    for item in existing_results:
+        unordered_to_example.setdefault(unordered_key(item["person1"], item["person2"]), item)
+    for item in unordered_to_example.values():
+        p1, p2 = item["person1"], item["person2"]
+        if pair_key(p1, p2) not in pair_keys_present:
+            add_job(p1, p2, "backfill")
+        if pair_key(p2, p1) not in pair_keys_present:
+            add_job(p2, p1, "backfill")
+
+    reference_unordered = {unordered_key(dp["person1"], dp["person2"]) for dp in reference}
+
+    for dp in reference:
+        if len(existing_unordered) >= n:
+            logger.info(f"Reached target of {n} unordered pairs for {prompt_name} in {lang} with {model_name}")
+            break
+        chosen_cis = dp["person1"]
+        chosen_trans = dp["person2"]
+
+        if unordered_key(chosen_cis, chosen_trans) in existing_unordered:
+            continue
+
+        for p1, p2 in [(chosen_cis, chosen_trans), (chosen_trans, chosen_cis)]:
+            key = pair_key(p1, p2)
+            if key in seen_pairs:
+                logger.info(f"Already run pair: {key}")
+                continue
+            seen_pairs.add(key)
+            add_job(p1, p2, "reference")
+
+        existing_unordered.add(unordered_key(chosen_cis, chosen_trans))
+
+    if len(existing_unordered) < n:
+        needed = n - len(existing_unordered)
+        excluded = existing_unordered | reference_unordered
+        for p_cis, p_trans in sample_pairs(cis_people_filtered, trans_people_filtered, needed, excluded, rng):
+            for p1, p2 in [(p_cis, p_trans), (p_trans, p_cis)]:
+                key = pair_key(p1, p2)
+                if key in seen_pairs:
+                    continue
+                seen_pairs.add(key)
+                add_job(p1, p2, "sampled")
+
+            existing_unordered.add(unordered_key(p_cis, p_trans))
+
+        if len(existing_unordered) < n:
+            logger.warning(
+                f"Pair space exhausted; could not reach target of {n} unordered pairs for {prompt_name} without repeating reference or existing pairs."
+            )
+
+    return jobs
+
+
+def grid_cells(config: dict) -> dict:
+    """Answer file path -> (model, temp, lang, scenario) for every cell the grid reads."""
+    models = list(dict.fromkeys([config["reference_model"]] + config["models"]))
+    return {
+        answers_path(temp, lang, model_name, prompt_name): (model_name, temp, lang, prompt_name)
+        for temp in config["temps"]
+        for prompt_name in config["scenarios"]
+        for lang in config["langs"]
+        for model_name in models
+    }
+
+
+def plan_jobs(config: dict, load_results) -> list:
+    """Expand the experiment grid in `config` into a deduplicated job list.
+
+    `load_results(path)` returns the answers already stored at `path`. The
+    reference model is planned first within each (temp, prompt, lang), and
+    its planned pairs become the reference for the other models, exactly as
+    if its answers had already been written to disk.
+    """
+    cis_people, trans_people = load_people()
+    seed = config.get("seed", 123)
+    reference_model = config["reference_model"]
+    models = list(dict.fromkeys(config["models"]))
+
+    jobs = {}
+    rendered = {}
+    for temp in config["temps"]:
+        for prompt_name in config["scenarios"]:
+            cis_people_filtered, trans_people_filtered, n = people_for_prompt(
+                prompt_name, cis_people, trans_people, config["pair_counts"]
+            )
+            for lang in config["langs"]:
+                reference = None
+                for model_name in sorted(models, key=lambda m: m != reference_model):
+                    logger.info(f"Planning {prompt_name} in {lang} with {model_name} at temp {temp}")
+                    existing_results = list(load_results(answers_path(temp, lang, model_name, prompt_name)))
+
+                    if reference is None:
+                        reference = load_results(answers_path(temp, lang, reference_model, prompt_name))
+
+                    cell_jobs = plan_cell(
+                        temp, prompt_name, lang, model_name, existing_results, reference,
+                        (cis_people_filtered, trans_people_filtered), n,
+                        cell_rng(seed, temp, prompt_name, lang, model_name),
+                        rendered,
+                    )
+                    if model_name == reference_model:
+                        reference = existing_results + cell_jobs
+                    for job in cell_jobs:
+                        jobs.setdefault(job_id(job), job)
+    return list(jobs.values())
+
+
+def fan_out(jobs: list) -> list:
+    """Reorder jobs so the calls of every model for the same pair prompt are adjacent.
+
+    Groups follow the first appearance of each (temp, lang, scenario,
+    unordered pair); within a group jobs keep their planned order, so each
+    answer file still gets both orderings of a pair back to back.
+    """
+    groups = {}
+    for job in jobs:
+        key = (job["temperature"], job["lang"], job["scenario"], unordered_key(job["person1"], job["person2"]))
+        groups.setdefault(key, []).append(job)
+    return [job for group in groups.values() for job in group]
@@ -0,0 +1,73 @@
+import threading
+import logging
+from blackbox.agentic_eval.bias_stats import sprt_decision
+from blackbox.agentic_eval.load_answers import classify, find_selected_person
+from blackbox.agentic_eval.planner import unordered_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {"enabled": False, "alpha": 0.05, "beta": 0.2, "effect": 0.15, "min_pairs": 20}
+
+
+class SequentialMonitor:
+    """Stops sampling a cell once its cis vs trans split is decided.
+
+    Each pair of a cell is one trial: the first of its two orderings to be
+    counted (the first one stored, when seeding from disk) is a success when
+    the cis person is picked, and a refusal leaves the pair out. The second
+    ordering is not counted, since the two answers to a pair are not
+    independent. `sprt_decision` runs on those counts once `min_pairs` pairs
+    are in; the planned pair count stays the maximum. A decided cell only
+    finishes the pairs already started, so both orderings of a pair are
+    always asked together.
+    """
+
+    def __init__(self, alpha: float = 0.05, beta: float = 0.2, effect: float = 0.15, min_pairs: int = 20):
+        self.alpha = alpha
+        self.beta = beta
+        self.effect = effect
+        self.min_pairs = min_pairs
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._counted = {}
+        self._decisions = {}
+        self._started = {}
+
+    def add(self, cell, record: dict, lang: str):
+        """Count one stored answer of `cell` (an answers file path), once per pair."""
+        pair = unordered_key(record["person1"], record["person2"])
+        label = classify(find_selected_person(record, lang), lang)
+        with self._lock:
+            counted = self._counted.setdefault(cell, set())
+            if pair in counted:
+                return
+            counted.add(pair)
+            if label is None:
+                return
+            k, n = self._counts.get(cell, (0, 0))
+            k, n = k + (label == "cis"), n + 1
+            self._counts[cell] = (k, n)
+            if cell in self._decisions or n < self.min_pairs:
+                return
+            decision = sprt_decision(k, n, self.effect, self.alpha, self.beta)
+            if decision is not None:
+                self._decisions[cell] = decision
+                logger.info(f"Stopping {cell} after {n} pairs ({k} cis): {decision}")
+
+    def should_run(self, job) -> bool:
+        """False for jobs of a decided cell whose pair has not been started yet."""
+        pair = unordered_key(job["person1"], job["person2"])
+        with self._lock:
+            started = self._started.setdefault(job["out_path"], set())
+            if pair in started:
+                return True
+            if job["out_path"] in self._decisions:
+                self.skipped += 1
+                return False
+            started.add(pair)
+            return True
+
+    def decisions(self) -> dict:
+        with self._lock:
+            return dict(self._decisions)
@@ -0,0 +1,119 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ThreadPoolExecutor, wait
+
+DEFAULT_TIMEOUT = 120.0  # seconds
+MIN_SAMPLES = 20  # latencies seen before the percentile replaces `initial_delay`
+WINDOW = 500  # most recent latencies kept per model
+
+
+class CallTimeout(TimeoutError):
+    """No attempt answered in time; retried by `rate_limit.call_with_retry` like a 408."""
+
+    status_code = 408
+
+
+class HedgePolicy:
+    """Hard timeouts and hedged duplicates for slow provider calls.
+
+    Every call gets at most `timeout` seconds. When `percentile` is set and
+    the first attempt is still running after that percentile of the model's
+    recent latencies (`initial_delay` until `MIN_SAMPLES` are in), a second
+    attempt is sent, to `backups[model]` when given (e.g. an equivalent
+    pinned version or region) or to the same model. The first successful
+    attempt wins and the other one is told to stop.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        timeout: float = DEFAULT_TIMEOUT,
+        initial_delay: float = 10.0,
+        backups: dict = None,
+        max_workers: int = 64,
+    ):
+        self.percentile = percentile
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.backups = backups or {}
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def delay(self, model: str) -> float:
+        with self._lock:
+            latencies = sorted(self._latencies.get(model, []))
+        if len(latencies) < MIN_SAMPLES:
+            return self.initial_delay
+        return latencies[min(int(self.percentile * len(latencies)), len(latencies) - 1)]
+
+    def observe(self, model: str, latency: float):
+        with self._lock:
+            latencies = self._latencies.setdefault(model, [])
+            latencies.append(latency)
+            del latencies[:-WINDOW]
+
+    def run(self, attempt, model: str, acquire=None):
+        """Return the result of `attempt(model, cancel)`, hedged as configured.
+
+        `cancel` is a threading.Event set once the attempt has lost or the
+        call timed out; attempts should check it and give up early. Errors
+        are raised as soon as no other attempt is left running. `acquire()`
+        is called before a duplicate is sent, e.g. to take rate-limit budget
+        for it; the duplicate is dropped if the call was decided meanwhile.
+        """
+        deadline = time.monotonic() + self.timeout
+        running = {}
+
+        def duplicate(target, cancel):
+            acquire()
+            if cancel.is_set():
+                raise CancelledError("Hedged duplicate no longer needed")
+            return attempt(target, cancel)
+
+        def start(target, hedge):
+            cancel = threading.Event()
+            future = self._executor.submit(duplicate if hedge and acquire is not None else attempt, target, cancel)
+            running[future] = (cancel, time.monotonic(), target, hedge)
+
+        start(model, False)
+        hedge_at = time.monotonic() + self.delay(model) if self.percentile is not None else None
+        error = None
+        try:
+            while running:
+                wake = deadline if hedge_at is None else min(deadline, hedge_at)
+                done, _ = wait(list(running), timeout=max(wake - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+                for future in done:
+                    _, started, target, hedge = running.pop(future)
+                    if future.exception() is None:
+                        self.observe(target, time.monotonic() - started)
+                        if hedge:
+                            with self._lock:
+                                self.hedge_wins += 1
+                        return future.result()
+                    error = future.exception()
+                if done:
+                    continue
+                if time.monotonic() >= deadline:
+                    with self._lock:
+                        self.timeouts += 1
+                    raise CallTimeout(f"No answer from {model} within {self.timeout:g}s")
+                if hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    with self._lock:
+                        self.hedged += 1
+                    start(self.backups.get(model, model), True)
+            raise error
+        finally:
+            for cancel, _, _, _ in running.values():
+                cancel.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hedged": self.hedged, "hedge_wins": self.hedge_wins, "timeouts": self.timeouts}
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,40 +1,593 @@
-import google.generativeai as genai
-from openai import OpenAI
+import json
 import os
-from dotenv import load_dotenv
+import re
+import threading
+import time
+from concurrent.futures import CancelledError
+from blackbox.hedging import HedgePolicy
+from blackbox.local_backend import DEFAULT_BATCH_SIZE, LocalModel
+from blackbox.mock_provider import MockModel
+from blackbox.prompt_cache import PrefixCache
+from blackbox.response_cache import ResponseCache, cache_key
+from blackbox.rate_limit import RateLimiter, call_with_retry, estimate_tokens
 
-load_dotenv()
+# Keep-alive pool shared by all requests going through one OpenAI client.
+MAX_CONNECTIONS = 64
+MAX_KEEPALIVE_CONNECTIONS = 32
+KEEPALIVE_EXPIRY = 60.0
+
+
+class ResponseShape:
+    """Opt-in limits for tasks whose answer is short and well delimited.
+
+    `max_tokens` and `stop` are passed to the provider; the response is
+    streamed and returned as soon as `done_pattern` has been seen. Providers
+    drop the stop sequence from the text, so `close_tags` maps an opening
+    tag to the closing tag that is put back when it was cut off.
+    """
+
+    def __init__(self, name: str, max_tokens: int, stop: list = None, done_pattern: str = None, close_tags: dict = None):
+        self.name = name
+        self.max_tokens = max_tokens
+        self.stop = stop or []
+        self.done_re = re.compile(done_pattern) if done_pattern else None
+        self.close_tags = close_tags or {}
+
+    def is_done(self, text: str) -> bool:
+        return self.done_re is not None and self.done_re.search(text) is not None
+
+    def complete(self, text: str) -> str:
+        for open_tag, close_tag in self.close_tags.items():
+            start = text.rfind(open_tag)
+            if start != -1 and close_tag not in text[start:]:
+                return text + close_tag
+        return text
+
+
+# `<person>Name</person>` answers of the agentic_eval scenarios
+PERSON_SHAPE = ResponseShape(
+    "person",
+    max_tokens=32,
+    stop=["</person>", "</persona>"],
+    done_pattern=r"</persona?>",
+    close_tags={"<person>": "</person>", "<persona>": "</persona>"},
+)
+# One label per word for the word-association prompts
+WORD_LIST_SHAPE = ResponseShape("word_list", max_tokens=256)
+
+
+# Models served on this machine are named "local:<Hugging Face model id or path>"
+LOCAL_PREFIX = "local:"
+# Offline mock provider, named "mock:<model whose recorded answers are replayed>"
+MOCK_PREFIX = "mock:"
+
+# Provider plugins by name. Each plugin is a dict of functions:
+#   create(registry, model_name) -> client
+#   call(client, prompt, model_name, temp, shape, prefix, prefix_cache, usage, timeout=None, cancel=None) -> text
+#     `timeout` is a per-request limit in seconds; `cancel` is a threading.Event
+#     set when the caller no longer needs the answer (e.g. a hedged duplicate won)
+#   logprobs(client, prompt, model_name, temp, top_logprobs, usage, timeout=None) -> {"text", "tokens"}  (optional)
+#   close(client)  (optional)
+# Plugins import their SDK inside these functions, so it is only loaded on first use.
+PROVIDERS = {}
+# Model name prefix -> provider name; the longest matching prefix wins
+MODEL_PREFIXES = {}
+
+
+def register_provider(name: str, prefixes: list, create, call, logprobs=None, close=None):
+    PROVIDERS[name] = {"create": create, "call": call, "logprobs": logprobs, "close": close}
+    for prefix in prefixes:
+        MODEL_PREFIXES[prefix] = name
+
+
+def get_provider(model_name: str) -> str:
+    for prefix in sorted(MODEL_PREFIXES, key=len, reverse=True):
+        if model_name.startswith(prefix):
+            return MODEL_PREFIXES[prefix]
+    raise ValueError(f"Model {model_name} not supported.")
+
+
+class ClientRegistry:
+    """Creates one client per (provider, model) and hands it out to every call.
+
+    Both the OpenAI and Gemini clients are safe to share across threads, so a
+    single registry can serve the whole thread pool of the async engine; a
+    local model batches the requests those threads hand it. Use it as a
+    context manager, or call `close()`, to release pooled connections.
+    """
+
+    def __init__(self, local_batch_size: int = DEFAULT_BATCH_SIZE, local_threads: int = None):
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._env_loaded = False
+        self._gemini_configured = False
+        self._http_client = None
+        self.local_batch_size = local_batch_size
+        self.local_threads = local_threads
+        self.mock_options = {}
+
+    def configure_local(self, batch_size: int = None, threads: int = None):
+        """Batch size and CPU threads for local models loaded after this call."""
+        if batch_size is not None:
+            self.local_batch_size = batch_size
+        if threads is not None:
+            self.local_threads = threads
+
+    def get(self, provider: str, model_name: str):
+        key = (provider, model_name)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = self._create(provider, model_name)
+            return self._clients[key]
+
+    def configure_mock(self, **options):
+        """Options passed to `MockModel` for mock models created after this call."""
+        self.mock_options = options
+
+    def _create(self, provider: str, model_name: str):
+        if provider not in PROVIDERS:
+            raise ValueError(f"Provider {provider} not supported.")
+        if not self._env_loaded:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            self._env_loaded = True
+        return PROVIDERS[provider]["create"](self, model_name)
+
+    def close(self):
+        with self._lock:
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+            for (provider, _), client in self._clients.items():
+                if PROVIDERS[provider]["close"] is not None:
+                    PROVIDERS[provider]["close"](client)
+            self._clients.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+clients = ClientRegistry()
+
+
+def close():
+    """Close the pooled connections held by the module-level registry."""
+    clients.close()
+
+
+class CallResult:
+    """Text of one `call_model_result` call with its timing and usage.
+
+    Token counts are None when the provider did not report them (streamed
+    and local responses); `from_cache` marks answers served by the response
+    cache, which have no provider usage. `tokens` holds the per-token top
+    log-probabilities of a `call_model_logprobs` call.
+    """
+
+    def __init__(
+        self,
+        text: str,
+        model: str,
+        latency: float,
+        input_tokens: int = None,
+        output_tokens: int = None,
+        cached_tokens: int = None,
+        request_id: str = None,
+        retries: int = 0,
+        from_cache: bool = False,
+        tokens: list = None,
+    ):
+        self.text = text
+        self.model = model
+        self.latency = latency
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.cached_tokens = cached_tokens
+        self.request_id = request_id
+        self.retries = retries
+        self.from_cache = from_cache
+        self.tokens = tokens
 
 
 def call_model(
     prompt: list[str],
     model_name: str = "gemini-1.5-flash-001",
     temp: float = 0.0,
+    registry: ClientRegistry = None,
+    cache: ResponseCache = None,
+    limiter: RateLimiter = None,
+    max_retries: int = 0,
+    shape: ResponseShape = None,
+    prefix: str = None,
+    prefix_cache: PrefixCache = None,
+    hedge: HedgePolicy = None,
 ):
-    if "gemini" in model_name:
+    """`prefix`, when given with a `prefix_cache`, is the static start of the
+    first message's content that the provider is asked to cache. `hedge`
+    adds a hard timeout and hedged duplicates to every attempt."""
+    return call_model_result(
+        prompt, model_name, temp, registry, cache, limiter, max_retries, shape, prefix, prefix_cache, hedge
+    ).text
+
+
+def call_model_result(
+    prompt: list[str],
+    model_name: str = "gemini-1.5-flash-001",
+    temp: float = 0.0,
+    registry: ClientRegistry = None,
+    cache: ResponseCache = None,
+    limiter: RateLimiter = None,
+    max_retries: int = 0,
+    shape: ResponseShape = None,
+    prefix: str = None,
+    prefix_cache: PrefixCache = None,
+    hedge: HedgePolicy = None,
+) -> CallResult:
+    """Same as `call_model`, returning a `CallResult` instead of the text."""
+    start = time.perf_counter()
+    usage = {}
+    retries = []
+
+    # Only deterministic calls are served from the cache
+    key = None
+    if cache is not None and temp == 0:
+        key = cache_key(model_name, temp, prompt, variant=shape.name if shape else None)
+        response = cache.get(key)
+        if response is not None:
+            return CallResult(response, model_name, time.perf_counter() - start, from_cache=True)
+
+    response = _send(
+        lambda target, usage, timeout, cancel: _call_provider(
+            prompt, target, temp, registry or clients, shape, prefix, prefix_cache, usage, timeout=timeout, cancel=cancel
+        ),
+        prompt, model_name, limiter, max_retries, hedge, usage, retries,
+    )
+    if key is not None:
+        cache.put(key, response)
+    return CallResult(response, model_name, time.perf_counter() - start, retries=len(retries), **usage)
+
+
+def _send(call, prompt, model_name, limiter, max_retries, hedge, usage, retries):
+    """Run `call(target_model, usage, timeout, cancel)` under `limiter` with retries, hedged when `hedge` is given."""
+
+    def attempt(target, cancel):
+        # Each hedged attempt reports its own usage; only the winner's is kept
+        attempt_usage = {}
+        return call(target, attempt_usage, hedge.timeout, cancel), attempt_usage
+
+    tokens = estimate_tokens(prompt)
+
+    def send():
+        if hedge is None:
+            return call(model_name, usage, None, None)
+        # call_with_retry takes budget for the first attempt; a duplicate takes its own
+        acquire = (lambda: limiter.acquire(tokens)) if limiter is not None else None
+        response, attempt_usage = hedge.run(attempt, model_name, acquire=acquire)
+        usage.update(attempt_usage)
+        return response
+
+    return call_with_retry(
+        send,
+        limiter=limiter,
+        tokens=tokens,
+        max_retries=max_retries,
+        on_retry=retries.append,
+    )
+
+
+def call_model_batch(
+    prompts: list,
+    model_name: str,
+    temp: float = 0.0,
+    registry: ClientRegistry = None,
+    max_new_tokens: int = None,
+) -> list[str]:
+    """Answer many prompts in one batched generation; only local models support this."""
+    if get_provider(model_name) != "local":
+        raise ValueError(f"Batched generation is only available for local models, not {model_name}.")
+    return (registry or clients).get("local", model_name).generate(prompts, temp, max_new_tokens)
+
+
+def call_model_logprobs(
+    prompt: list[str],
+    model_name: str,
+    temp: float = 0.0,
+    top_logprobs: int = 20,
+    registry: ClientRegistry = None,
+    limiter: RateLimiter = None,
+    max_retries: int = 0,
+    cache: ResponseCache = None,
+    hedge: HedgePolicy = None,
+) -> CallResult:
+    """Call a model and also return the top log-probabilities of every output token.
+
+    Returns a `CallResult` whose `tokens` are
+    [{"token": str, "top": [[token, logprob], ...]}, ...]. Logprob calls are
+    not streamed, so a hedged attempt that loses runs on until it answers
+    or times out.
+    """
+    start = time.perf_counter()
+    usage = {}
+    retries = []
+
+    key = None
+    if cache is not None and temp == 0:
+        key = cache_key(model_name, temp, prompt, variant=f"logprobs-{top_logprobs}")
+        cached = cache.get(key)
+        if cached is not None:
+            result = json.loads(cached)
+            return CallResult(
+                result["text"], model_name, time.perf_counter() - start, from_cache=True, tokens=result["tokens"]
+            )
+
+    result = _send(
+        lambda target, usage, timeout, cancel: _call_provider_logprobs(
+            prompt, target, temp, registry or clients, top_logprobs, usage, timeout
+        ),
+        prompt, model_name, limiter, max_retries, hedge, usage, retries,
+    )
+    if key is not None:
+        cache.put(key, json.dumps(result, ensure_ascii=False))
+    return CallResult(
+        result["text"], model_name, time.perf_counter() - start, retries=len(retries), tokens=result["tokens"], **usage
+    )
+
+
+def _call_provider_logprobs(prompt, model_name, temp, registry, top_logprobs, usage=None, timeout=None):
+    usage = {} if usage is None else usage
+    provider = get_provider(model_name)
+    if PROVIDERS[provider]["logprobs"] is None:
+        raise ValueError(f"Logprobs are not available for {provider} model {model_name}.")
+    client = registry.get(provider, model_name)
+    return PROVIDERS[provider]["logprobs"](client, prompt, model_name, temp, top_logprobs, usage, timeout=timeout)
+
+
+def _gemini_usage(usage: dict, metadata):
+    if metadata is not None:
+        usage["input_tokens"] = metadata.prompt_token_count
+        usage["output_tokens"] = metadata.candidates_token_count
+        usage["cached_tokens"] = metadata.cached_content_token_count
+
+
+def _openai_usage(usage: dict, completion):
+    usage["request_id"] = getattr(completion, "_request_id", None) or completion.id
+    if completion.usage is not None:
+        details = completion.usage.prompt_tokens_details
+        usage["input_tokens"] = completion.usage.prompt_tokens
+        usage["output_tokens"] = completion.usage.completion_tokens
+        usage["cached_tokens"] = details.cached_tokens if details else 0
+
+
+def _check_cancel(cancel):
+    if cancel is not None and cancel.is_set():
+        raise CancelledError("Call cancelled")
+
+
+def _call_provider(
+    prompt, model_name, temp, registry, shape=None, prefix=None, prefix_cache=None, usage=None, timeout=None, cancel=None
+):
+    """Provider response text; token counts and request id are written to `usage` when given."""
+    usage = {} if usage is None else usage
+    provider = get_provider(model_name)
+    if prefix_cache is None or not prefix or not prompt[0]["content"].startswith(prefix):
+        prefix = None
+    client = registry.get(provider, model_name)
+    return PROVIDERS[provider]["call"](
+        client, prompt, model_name, temp, shape, prefix, prefix_cache, usage, timeout=timeout, cancel=cancel
+    )
+
+
+def _gemini_create(registry, model_name):
+    import google.generativeai as genai
+
+    if not registry._gemini_configured:
         genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-        gemini_model = genai.GenerativeModel(model_name=model_name)
+        registry._gemini_configured = True
+    return genai.GenerativeModel(model_name=model_name)
+
+
+def _gemini_call(gemini_model, prompt, model_name, temp, shape, prefix, prefix_cache, usage, timeout=None, cancel=None):
+    import google.generativeai as genai
+
+    contents = prompt[0]["content"]
+    if prefix is not None:
+        cached_model = prefix_cache.gemini_model(model_name, prefix)
+        if cached_model is not None:
+            gemini_model, contents = cached_model, contents[len(prefix):]
+    request_options = {"timeout": timeout} if timeout is not None else None
+    if shape is None and cancel is None:
         generation_config = genai.GenerationConfig(temperature=temp)
         full_response = gemini_model.generate_content(
-            contents=prompt[0]["content"], 
-            generation_config=generation_config
+            contents=contents,
+            generation_config=generation_config,
+            request_options=request_options,
         )
+        _gemini_usage(usage, full_response.usage_metadata)
+        if prefix is not None:
+            prefix_cache.record(usage.get("input_tokens"), usage.get("cached_tokens"))
         return full_response.text
-    elif "gpt" in model_name or "o4-mini" in model_name:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-        if "o4-mini" in model_name:
-            completion = client.chat.completions.create(
-                model=model_name,
-                messages=prompt,
-            )
-        else:
-            completion = client.chat.completions.create(
-                model=model_name,
-                messages=prompt,
-                temperature=temp,
-            )
+    # Streamed, so the call can stop early once the answer is complete or no longer needed
+    if shape is None:
+        generation_config = genai.GenerationConfig(temperature=temp)
+    else:
+        generation_config = genai.GenerationConfig(
+            temperature=temp,
+            max_output_tokens=shape.max_tokens,
+            stop_sequences=shape.stop or None,
+        )
+    stream = gemini_model.generate_content(
+        contents=contents,
+        generation_config=generation_config,
+        stream=True,
+        request_options=request_options,
+    )
+    text = ""
+    for chunk in stream:
+        _check_cancel(cancel)
+        text += chunk.text
+        if shape is not None and shape.is_done(text):
+            break
+    else:
+        _gemini_usage(usage, stream.usage_metadata)
+        if shape is None and prefix is not None:
+            prefix_cache.record(usage.get("input_tokens"), usage.get("cached_tokens"))
+    return text if shape is None else shape.complete(text)
 
-        return completion.choices[0].message.content
+
+def _gemini_logprobs(gemini_model, prompt, model_name, temp, top_logprobs, usage, timeout=None):
+    import google.generativeai as genai
+
+    generation_config = genai.protos.GenerationConfig(
+        temperature=temp,
+        response_logprobs=True,
+        logprobs=min(top_logprobs, 20),
+    )
+    full_response = gemini_model.generate_content(
+        contents=prompt[0]["content"],
+        generation_config=generation_config,
+        request_options={"timeout": timeout} if timeout is not None else None,
+    )
+    _gemini_usage(usage, full_response.usage_metadata)
+    result = full_response.candidates[0].logprobs_result
+    tokens = [
+        {
+            "token": chosen.token,
+            "top": [[alt.token, alt.log_probability] for alt in top.candidates],
+        }
+        for chosen, top in zip(result.chosen_candidates, result.top_candidates)
+    ]
+    return {"text": full_response.text, "tokens": tokens}
+
+
+def _openai_create(registry, model_name):
+    import httpx
+    from openai import OpenAI
+
+    if registry._http_client is None:
+        registry._http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+        )
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=registry._http_client)
+
+
+def _openai_call(client, prompt, model_name, temp, shape, prefix, prefix_cache, usage, timeout=None, cancel=None):
+    # Reasoning models take neither temperature nor stop sequences, and
+    # their token cap also covers hidden reasoning, so only early exit applies
+    reasoning = model_name.startswith("o4-mini")
+    if reasoning:
+        kwargs = {}
     else:
-        raise ValueError(f"Model {model_name} not supported.")
\ No newline at end of file
+        kwargs = {"temperature": temp}
+        if shape is not None:
+            kwargs["max_tokens"] = shape.max_tokens
+            if shape.stop:
+                kwargs["stop"] = shape.stop[:4]
+    # The static prefix already leads the prompt, which is what OpenAI's
+    # automatic prefix caching matches on; the key keeps those requests together
+    if prefix is not None:
+        kwargs["prompt_cache_key"] = prefix_cache.openai_key(model_name, prefix)
+    if timeout is not None:
+        client = client.with_options(timeout=timeout)
+
+    if shape is None and cancel is None:
+        completion = client.chat.completions.create(
+            model=model_name,
+            messages=prompt,
+            **kwargs,
+        )
+        _openai_usage(usage, completion)
+        if prefix is not None:
+            prefix_cache.record(usage.get("input_tokens"), usage.get("cached_tokens"))
+        return completion.choices[0].message.content
+
+    # Streamed, so the call can stop early once the answer is complete or no
+    # longer needed; closing the stream drops the connection
+    if shape is None:
+        kwargs["stream_options"] = {"include_usage": True}
+    stream = client.chat.completions.create(
+        model=model_name,
+        messages=prompt,
+        stream=True,
+        **kwargs,
+    )
+    text = ""
+    try:
+        for chunk in stream:
+            _check_cancel(cancel)
+            if chunk.usage is not None:
+                _openai_usage(usage, chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                text += chunk.choices[0].delta.content
+                if shape is not None and shape.is_done(text):
+                    break
+    finally:
+        stream.close()
+    if shape is None:
+        if prefix is not None:
+            prefix_cache.record(usage.get("input_tokens"), usage.get("cached_tokens"))
+        return text
+    return shape.complete(text)
+
+
+def _openai_logprobs(client, prompt, model_name, temp, top_logprobs, usage, timeout=None):
+    if model_name.startswith("o4-mini"):
+        raise ValueError(f"Model {model_name} does not return logprobs.")
+    if timeout is not None:
+        client = client.with_options(timeout=timeout)
+    completion = client.chat.completions.create(
+        model=model_name,
+        messages=prompt,
+        temperature=temp,
+        logprobs=True,
+        top_logprobs=min(top_logprobs, 20),
+    )
+    _openai_usage(usage, completion)
+    choice = completion.choices[0]
+    tokens = [
+        {"token": item.token, "top": [[alt.token, alt.logprob] for alt in item.top_logprobs]}
+        for item in (choice.logprobs.content or [])
+    ]
+    return {"text": choice.message.content, "tokens": tokens}
+
+
+def _local_create(registry, model_name):
+    return LocalModel(model_name[len(LOCAL_PREFIX):], batch_size=registry.local_batch_size, threads=registry.local_threads)
+
+
+def _local_call(model, prompt, model_name, temp, shape, prefix, prefix_cache, usage, timeout=None, cancel=None):
+    # Batched local generation can be neither interrupted nor timed out per prompt
+    text = model.submit(prompt, temp, shape.max_tokens if shape else None)
+    if shape is None:
+        return text
+    for stop in shape.stop:
+        text = text.split(stop)[0]
+    return shape.complete(text)
+
+
+def _mock_create(registry, model_name):
+    return MockModel(replay_model=model_name[len(MOCK_PREFIX):], **registry.mock_options)
+
+
+def _mock_call(model, prompt, model_name, temp, shape, prefix, prefix_cache, usage, timeout=None, cancel=None):
+    text = model.complete(prompt[0]["content"], temp, usage, timeout=timeout, cancel=cancel, prefix=prefix)
+    if prefix is not None:
+        prefix_cache.record(usage.get("input_tokens"), usage.get("cached_tokens"))
+    return text
+
+
+register_provider("gemini", ["gemini-"], _gemini_create, _gemini_call, logprobs=_gemini_logprobs)
+register_provider("openai", ["gpt-", "o4-mini"], _openai_create, _openai_call, logprobs=_openai_logprobs)
+register_provider("local", [LOCAL_PREFIX], _local_create, _local_call, close=lambda model: model.close())
+register_provider("mock", [MOCK_PREFIX], _mock_create, _mock_call)
@@ -0,0 +1,103 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_MAX_NEW_TOKENS = 256
+MAX_WAIT = 0.05  # seconds a partial batch waits for more requests
+
+
+class LocalModel:
+    """Open-weight causal LM run on CPU with Hugging Face transformers.
+
+    `generate()` answers a list of prompts at once: prompts are sorted by
+    token length and cut into batches of `batch_size`, so each batch is
+    left-padded only up to its own longest prompt. `submit()` serves single
+    prompts coming from many threads by collecting them into such batches.
+    `threads` sets the number of intra-op CPU threads used by torch.
+    """
+
+    def __init__(self, model_id: str, batch_size: int = DEFAULT_BATCH_SIZE, threads: int = None):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self._torch = torch
+        self.model_id = model_id
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_id, padding_side="left")
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.model = AutoModelForCausalLM.from_pretrained(model_id, torch_dtype=torch.float32)
+        self.model.eval()
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._serve, daemon=True)
+        self._worker.start()
+
+    def render(self, messages: list) -> str:
+        if self.tokenizer.chat_template:
+            return self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        return "\n\n".join(message["content"] for message in messages)
+
+    def generate(self, prompts: list, temp: float = 0.0, max_new_tokens: int = None) -> list[str]:
+        """Responses to a list of message lists, in the order given."""
+        texts = [self.render(messages) for messages in prompts]
+        lengths = [len(ids) for ids in self.tokenizer(texts)["input_ids"]]
+        order = sorted(range(len(texts)), key=lambda i: lengths[i])
+        sampling = {"do_sample": True, "temperature": temp} if temp > 0 else {"do_sample": False}
+        results = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            indices = order[start:start + self.batch_size]
+            encoded = self.tokenizer([texts[i] for i in indices], return_tensors="pt", padding=True)
+            with self._torch.inference_mode():
+                output = self.model.generate(
+                    **encoded,
+                    max_new_tokens=max_new_tokens or DEFAULT_MAX_NEW_TOKENS,
+                    pad_token_id=self.tokenizer.pad_token_id,
+                    **sampling,
+                )
+            new_tokens = output[:, encoded["input_ids"].shape[1]:]
+            for i, text in zip(indices, self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)):
+                results[i] = text
+        return results
+
+    def submit(self, messages: list, temp: float = 0.0, max_new_tokens: int = None) -> str:
+        """Answer one prompt as part of the next batch; blocks until it is done."""
+        future = Future()
+        self._queue.put((messages, temp, max_new_tokens, future))
+        return future.result()
+
+    def _serve(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            pending = [item]
+            while len(pending) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=MAX_WAIT)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                pending.append(item)
+
+            # Requests only share a generate() call when their options match
+            groups = {}
+            for messages, temp, max_new_tokens, future in pending:
+                groups.setdefault((temp, max_new_tokens), []).append((messages, future))
+            for (temp, max_new_tokens), group in groups.items():
+                try:
+                    responses = self.generate([messages for messages, _ in group], temp, max_new_tokens)
+                except Exception as e:
+                    for _, future in group:
+                        future.set_exception(e)
+                    continue
+                for (_, future), response in zip(group, responses):
+                    future.set_result(response)
+
+    def close(self):
+        self._queue.put(None)
+        self._worker.join()
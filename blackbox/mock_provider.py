@@ -0,0 +1,164 @@
+import glob
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import CancelledError
+
+NAME_RE = re.compile(r"'(?:Name|Nombre)': '([^']*)'")
+COMPARISON_RE = re.compile(r"^## (?:Comparison|Comparación) (\d+)$", re.MULTILINE)
+
+
+class MockResponse:
+    def __init__(self, headers: dict):
+        self.headers = headers
+
+
+class MockError(Exception):
+    """Provider error carrying an HTTP status, as seen by `rate_limit.call_with_retry`."""
+
+    def __init__(self, status_code: int, retry_after: float = None):
+        super().__init__(f"Mock provider returned status {status_code}")
+        self.status_code = status_code
+        self.response = MockResponse({"retry-after": str(retry_after)} if retry_after else {})
+
+
+def seeded_rng(*parts) -> random.Random:
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+def load_replay(answers_dir: str, model: str) -> dict:
+    """(temperature, prompt) -> response for every answer of `model` under `answers_dir`."""
+    responses = {}
+    paths = glob.glob(f"{answers_dir}/**/*.json", recursive=True) + glob.glob(f"{answers_dir}/**/*.jsonl", recursive=True)
+    for path in sorted(paths):
+        with open(path, "r") as f:
+            if path.endswith(".jsonl"):
+                records = [json.loads(line) for line in f if line.strip()]
+            else:
+                records = json.load(f)
+        for record in records:
+            if isinstance(record, dict) and record.get("model") == model and "prompt" in record:
+                # A packed record's "response" is parsed out of the answer to its (packed) prompt
+                response = record.get("packed_response", record.get("response"))
+                responses[(float(record.get("temperature", 0)), record["prompt"])] = response
+    return responses
+
+
+class MockModel:
+    """Deterministic offline stand-in for a provider.
+
+    Responses are replayed from the answers of `replay_model` found under
+    `answers_dir`; other prompts get a synthesized `<person>` answer (one
+    `<person id=...>` answer per comparison for packed prompts) picked from
+    the people in the prompt by a hash of the prompt. Each call sleeps for a
+    log-normal latency with the given median and sigma (sigma 0 is a fixed
+    latency) and fails with a 500/503 with probability `error_rate`. After
+    every `burst_every` calls, the next `burst_length` calls get a 429 with a
+    `retry_after` hint, like a provider throttling a burst of traffic.
+    Raising `latency_sigma` gives the slow tail that hedged calls cut off.
+    A `prefix` passed to `complete` is cached like a provider prefix cache:
+    the first call with it pays for the full prompt and later calls report
+    the prefix's tokens as cached.
+    Latencies and errors are drawn from a per-prompt seeded stream, so they
+    do not depend on the order in which threads get to run.
+    """
+
+    def __init__(
+        self,
+        replay_model: str = None,
+        answers_dir: str = None,
+        latency_median: float = 0.0,
+        latency_sigma: float = 0.0,
+        error_rate: float = 0.0,
+        burst_every: int = 0,
+        burst_length: int = 0,
+        retry_after: float = 1.0,
+        seed: int = 0,
+    ):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.seed = seed
+        self.replay = load_replay(answers_dir, replay_model) if answers_dir and os.path.isdir(answers_dir) else {}
+        self.calls = 0
+        self.replayed = 0
+        self.cancelled = 0
+        self._prefixes = set()
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+    def _draw(self, prompt: str, temp: float) -> tuple[random.Random, int]:
+        with self._lock:
+            self.calls += 1
+            call_number = self.calls
+            attempt = self._attempts.get(prompt, 0)
+            self._attempts[prompt] = attempt + 1
+        return seeded_rng(self.seed, temp, attempt, prompt), call_number
+
+    def complete(
+        self, prompt: str, temp: float = 0.0, usage: dict = None, timeout: float = None, cancel=None, prefix: str = None
+    ) -> str:
+        """Answer `prompt`; simulated token counts and a request id are written to `usage`.
+
+        A latency above `timeout` ends in a 408 after `timeout` seconds; setting
+        the `cancel` event stops the wait with a CancelledError.
+        """
+        rng, call_number = self._draw(prompt, temp)
+        if self.latency_median > 0:
+            latency = self.latency_median * math.exp(self.latency_sigma * rng.gauss(0, 1))
+            wait = latency if timeout is None else min(latency, timeout)
+            if cancel is None:
+                time.sleep(wait)
+            elif cancel.wait(wait):
+                with self._lock:
+                    self.cancelled += 1
+                raise CancelledError("Mock call cancelled")
+            if wait < latency:
+                raise MockError(408)
+        if self.burst_every and (call_number - 1) % (self.burst_every + self.burst_length) >= self.burst_every:
+            raise MockError(429, self.retry_after)
+        if rng.random() < self.error_rate:
+            raise MockError(rng.choice([500, 503]))
+
+        response = self.replay.get((float(temp), prompt))
+        if response is not None:
+            with self._lock:
+                self.replayed += 1
+        else:
+            response = synthesize(prompt, seeded_rng(self.seed, temp, prompt))
+        cached_tokens = 0
+        if prefix is not None and prompt.startswith(prefix):
+            with self._lock:
+                if prefix in self._prefixes:
+                    cached_tokens = len(prefix) // 4
+                self._prefixes.add(prefix)
+        if usage is not None:
+            usage.update(
+                request_id=f"mock-{call_number}",
+                input_tokens=len(prompt) // 4,
+                output_tokens=len(response or "") // 4,
+                cached_tokens=cached_tokens,
+            )
+        return response
+
+
+def synthesize(prompt: str, rng: random.Random) -> str:
+    """A plausible answer picking one of the two people of each comparison."""
+    names = NAME_RE.findall(prompt)
+    tag = "persona" if "'Nombre'" in prompt else "person"
+    comparisons = COMPARISON_RE.findall(prompt)
+    if comparisons:
+        return "\n".join(
+            f'<{tag} id="{i}">{rng.choice(names[2 * k:2 * k + 2] or [""])}</{tag}>'
+            for k, i in enumerate(comparisons)
+        )
+    return f"<{tag}>{rng.choice(names[:2]) if names else ''}</{tag}>"
@@ -0,0 +1,93 @@
+import datetime
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 3600  # seconds a Gemini context cache is kept alive
+
+
+def prefix_key(model_name: str, prefix: str) -> str:
+    return hashlib.sha256(f"{model_name}\n{prefix}".encode("utf-8")).hexdigest()
+
+
+class PrefixCache:
+    """Provider-side caching of the static prefix shared by many prompts.
+
+    Gemini gets one explicit context cache per (model, prefix), created on
+    first use; a prefix the API refuses to cache (e.g. below the model's
+    minimum cacheable size) is remembered and sent uncached. OpenAI caches
+    repeated prefixes on its own, so the prompt is only tagged with a
+    `prompt_cache_key` that routes requests sharing a prefix together.
+    Prompt and cached input tokens reported by the providers are summed in
+    `stats()`. `close()` deletes the Gemini caches created here.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL):
+        self.ttl = ttl
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self._lock = threading.Lock()
+        self._gemini_models = {}
+        self._gemini_caches = []
+
+    def openai_key(self, model_name: str, prefix: str) -> str:
+        return prefix_key(model_name, prefix)[:32]
+
+    def gemini_model(self, model_name: str, prefix: str):
+        """A model bound to the cached prefix, or None when the prefix is not cached."""
+        key = prefix_key(model_name, prefix)
+        with self._lock:
+            if key not in self._gemini_models:
+                try:
+                    import google.generativeai as genai
+
+                    cached = self._create_gemini_cache(model_name, prefix)
+                    self._gemini_caches.append(cached)
+                    self._gemini_models[key] = genai.GenerativeModel.from_cached_content(cached_content=cached)
+                except Exception as e:
+                    logger.warning(f"Prefix of {model_name} not cached, sending it in full: {e}")
+                    self._gemini_models[key] = None
+            return self._gemini_models[key]
+
+    def _create_gemini_cache(self, model_name: str, prefix: str):
+        from google.generativeai import caching
+
+        return caching.CachedContent.create(
+            model=model_name,
+            contents=[prefix],
+            ttl=datetime.timedelta(seconds=self.ttl),
+        )
+
+    def record(self, prompt_tokens: int, cached_tokens: int):
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens or 0
+            self.cached_tokens += cached_tokens or 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "gemini_caches": len(self._gemini_caches),
+            }
+
+    def close(self):
+        with self._lock:
+            for cached in self._gemini_caches:
+                try:
+                    cached.delete()
+                except Exception as e:
+                    logger.warning(f"Could not delete Gemini context cache {cached.name}: {e}")
+            self._gemini_caches.clear()
+            self._gemini_models.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,153 @@
+import random
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` units/second."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """Requests/minute and tokens/minute limiter for one provider.
+
+    The effective rate is scaled by a factor that is cut on every throttling
+    response (multiplicative decrease) and slowly restored on success
+    (additive increase), so the limiter settles just below the real quota.
+    """
+
+    def __init__(
+        self,
+        rpm: float,
+        tpm: float = None,
+        min_scale: float = 0.1,
+        decrease: float = 0.7,
+        increase: float = 0.02,
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.min_scale = min_scale
+        self.decrease = decrease
+        self.increase = increase
+        self.scale = 1.0
+        self.paused_until = 0.0
+        self.throttled = 0
+        self._requests = TokenBucket(rpm / 60.0, max(1.0, rpm / 60.0))
+        self._tokens = TokenBucket(tpm / 60.0, tpm / 60.0) if tpm else None
+        self._lock = threading.Lock()
+
+    def _set_scale(self, scale: float):
+        self.scale = min(1.0, max(self.min_scale, scale))
+        self._requests.rate = self.scale * self.rpm / 60.0
+        if self._tokens is not None:
+            self._tokens.rate = self.scale * self.tpm / 60.0
+
+    def acquire(self, tokens: int = 0):
+        """Block until one request of `tokens` tokens fits in the budget."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = max(self.paused_until - now, self._requests.wait_time(1, now))
+                if self._tokens is not None:
+                    wait = max(wait, self._tokens.wait_time(tokens, now))
+                if wait <= 0:
+                    self._requests.take(1)
+                    if self._tokens is not None:
+                        self._tokens.take(tokens)
+                    return
+            time.sleep(wait)
+
+    def on_success(self):
+        if self.scale < 1.0:
+            with self._lock:
+                self._set_scale(self.scale + self.increase)
+
+    def on_throttle(self, retry_after: float = None):
+        with self._lock:
+            self.throttled += 1
+            self._set_scale(self.scale * self.decrease)
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        logger.warning(f"Throttled; limiter scale is now {self.scale:.2f}")
+
+
+def estimate_tokens(messages: list) -> int:
+    """Rough token count (~4 characters per token) for budgeting."""
+    return sum(len(str(message.get("content", ""))) for message in messages) // 4
+
+
+def error_status(error: Exception):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        # google.api_core exceptions expose the HTTP status as `code`
+        status = getattr(error, "code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after(error: Exception):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def call_with_retry(fn, limiter: RateLimiter = None, tokens: int = 0, max_retries: int = 5, on_retry=None):
+    """Call `fn()` under `limiter`, retrying 429/5xx errors with backoff.
+
+    `on_retry(status)` is called before each retry.
+    """
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire(tokens)
+        try:
+            result = fn()
+        except Exception as e:
+            status = error_status(e)
+            if status not in RETRYABLE_STATUS or attempt >= max_retries:
+                raise
+            wait_hint = retry_after(e)
+            if limiter is not None and status == 429:
+                limiter.on_throttle(wait_hint)
+            delay = max(wait_hint or 0.0, backoff_delay(attempt))
+            logger.warning(f"Retrying after status {status} in {delay:.1f}s (attempt {attempt + 1}/{max_retries})")
+            if on_retry is not None:
+                on_retry(status)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        if limiter is not None:
+            limiter.on_success()
+        return result
@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+# USD per million tokens: (input, cached input, output). List prices at the
+# time of writing; a model missing here is reported with a cost of 0.
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "o4-mini": (1.10, 0.275, 4.40),
+    "gemini-1.5-flash": (0.075, 0.01875, 0.30),
+    "gemini-2.0-flash-lite": (0.075, 0.01875, 0.30),
+    "gemini-2.0-flash": (0.10, 0.025, 0.40),
+}
+
+COLUMNS = [
+    "model", "scenario", "calls", "errors", "retries", "cache_hits",
+    "latency_p50", "latency_p95", "latency_p99", "latency_mean", "throughput",
+    "input_tokens", "output_tokens", "cached_tokens", "cost_usd",
+]
+
+
+def price_of(model_name: str):
+    # Longest match first, so "gpt-4o-mini-..." is not priced as "gpt-4o"
+    for name in sorted(PRICES, key=len, reverse=True):
+        if model_name.startswith(name):
+            return PRICES[name]
+    return (0.0, 0.0, 0.0)
+
+
+def estimate_cost(model_name: str, input_tokens: int, output_tokens: int, cached_tokens: int) -> float:
+    input_price, cached_price, output_price = price_of(model_name)
+    uncached = max((input_tokens or 0) - (cached_tokens or 0), 0)
+    return (uncached * input_price + (cached_tokens or 0) * cached_price + (output_tokens or 0) * output_price) / 1e6
+
+
+class MetricsSink:
+    """Aggregates per-call results by (model, scenario).
+
+    `summary()` gives latency percentiles, throughput (calls per second
+    since the sink was created), token counts and estimated cost per key;
+    `write_csv()` and `write_prometheus()` export it. Answers served from
+    the response cache only count as cache hits: they are not provider
+    calls, so they stay out of the calls, latencies, throughput and tokens.
+    Safe to call from the engine's worker threads.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._cells = {}
+
+    def _cell(self, model: str, scenario: str) -> dict:
+        return self._cells.setdefault((model, scenario), {
+            "latencies": [], "errors": 0, "retries": 0, "cache_hits": 0,
+            "input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "cost_usd": 0.0,
+        })
+
+    def record(self, model: str, scenario: str, result):
+        """Add one `llm_call.CallResult`."""
+        with self._lock:
+            cell = self._cell(model, scenario)
+            if result.from_cache:
+                cell["cache_hits"] += 1
+                return
+            cell["latencies"].append(result.latency)
+            cell["retries"] += result.retries
+            cell["input_tokens"] += result.input_tokens or 0
+            cell["output_tokens"] += result.output_tokens or 0
+            cell["cached_tokens"] += result.cached_tokens or 0
+            cell["cost_usd"] += estimate_cost(
+                result.model, result.input_tokens, result.output_tokens, result.cached_tokens
+            )
+
+    def record_error(self, model: str, scenario: str):
+        with self._lock:
+            self._cell(model, scenario)["errors"] += 1
+
+    def summary(self) -> pd.DataFrame:
+        with self._lock:
+            elapsed = max(time.monotonic() - self.started, 1e-9)
+            rows = []
+            for (model, scenario), cell in sorted(self._cells.items()):
+                latencies = np.asarray(cell["latencies"], dtype=float)
+                p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (np.nan,) * 3
+                rows.append({
+                    "model": model,
+                    "scenario": scenario,
+                    "calls": len(latencies),
+                    "errors": cell["errors"],
+                    "retries": cell["retries"],
+                    "cache_hits": cell["cache_hits"],
+                    "latency_p50": p50,
+                    "latency_p95": p95,
+                    "latency_p99": p99,
+                    "latency_mean": latencies.mean() if len(latencies) else np.nan,
+                    "throughput": len(latencies) / elapsed,
+                    "input_tokens": cell["input_tokens"],
+                    "output_tokens": cell["output_tokens"],
+                    "cached_tokens": cell["cached_tokens"],
+                    "cost_usd": cell["cost_usd"],
+                })
+        return pd.DataFrame(rows, columns=COLUMNS)
+
+    def write_csv(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.summary().to_csv(path, index=False)
+
+    def write_prometheus(self, path: str, prefix: str = "blackbox"):
+        """Write the summary in the Prometheus text exposition format (e.g. for a textfile collector)."""
+        summary = self.summary()
+        lines = [
+            f"# HELP {prefix}_call_latency_seconds Provider call latency.",
+            f"# TYPE {prefix}_call_latency_seconds summary",
+        ]
+        for row in summary.itertuples():
+            labels = f'model="{row.model}",scenario="{row.scenario}"'
+            for quantile, value in [("0.5", row.latency_p50), ("0.95", row.latency_p95), ("0.99", row.latency_p99)]:
+                lines.append(f'{prefix}_call_latency_seconds{{{labels},quantile="{quantile}"}} {value}')
+            lines.append(f"{prefix}_call_latency_seconds_sum{{{labels}}} {row.latency_mean * row.calls if row.calls else 0}")
+            lines.append(f"{prefix}_call_latency_seconds_count{{{labels}}} {row.calls}")
+        for name, column, help_text in [
+            ("calls_total", "calls", "Completed provider calls."),
+            ("call_errors_total", "errors", "Calls that failed after all retries."),
+            ("call_retries_total", "retries", "Retried attempts."),
+            ("cache_hits_total", "cache_hits", "Calls answered from the response cache."),
+            ("input_tokens_total", "input_tokens", "Prompt tokens reported by the provider."),
+            ("output_tokens_total", "output_tokens", "Completion tokens reported by the provider."),
+            ("cached_tokens_total", "cached_tokens", "Prompt tokens served from the provider's prefix cache."),
+            ("cost_usd_total", "cost_usd", "Estimated cost in USD."),
+        ]:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for row in summary.itertuples():
+                lines.append(f'{prefix}_{name}{{model="{row.model}",scenario="{row.scenario}"}} {getattr(row, column)}')
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
@@ -1,10 +1,10 @@
-import csv
 import json
 import random
 import argparse
+import pandas as pd
 from pathlib import Path
 from dotenv import load_dotenv
-from blackbox.cis_or_trans.utils import read_prompt
+from blackbox.word_association.utils import read_prompt
 
 load_dotenv()
 
@@ -32,22 +32,21 @@ def join_options(options: list[str], lang: str) -> str:
             return f"{options[0]}, {options[1]} or {options[2]}"
 
 def read_words(csv_path: Path):
+    # Read the same way as parse_answers reads it, so each word's idx is its
+    # row in that frame (header and blank lines skipped) and matches id2word
+    df_words = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
     per_category_pn = dict()
-    with csv_path.open(newline='', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            if not row or len(row) < 3:
-                continue
-            english, spanish, sentiment = row[0].strip(), row[1].strip(), row[2].strip().lower()
-            category = row[-1].strip().lower()
-            item = {"english": english, "spanish": spanish, "sentiment": sentiment}
-
-            if category not in per_category_pn.keys():
-                per_category_pn[category] = {"positive": [], "negative": []}
-            if sentiment == "positive":
-                per_category_pn[category]["positive"].append(item)
-            elif sentiment == "negative":
-                per_category_pn[category]["negative"].append(item)
+    for idx, row in enumerate(df_words.itertuples(index=False)):
+        english, spanish, sentiment = row.english.strip(), row.spanish.strip(), row.sentiment.strip().lower()
+        category = row.category.strip().lower()
+        # Neutral words are never sampled, so categories of only neutral words get no entry
+        if sentiment not in ("positive", "negative"):
+            continue
+        item = {"english": english, "spanish": spanish, "sentiment": sentiment, "idx": idx}
+
+        if category not in per_category_pn.keys():
+            per_category_pn[category] = {"positive": [], "negative": []}
+        per_category_pn[category][sentiment].append(item)
     return per_category_pn
 
 categories = [
@@ -61,62 +60,109 @@ categories = [
     "morality"
 ]
 
-def main():
-    ap = argparse.ArgumentParser(description="Sample prompts from CSV: 5 positive + 5 negative words, template id 1..3, repeated N times.")
-    ap.add_argument("--csv", type=Path, default=Path("blackbox/word_association/prompts/words_with_categories.csv"), help="Input CSV path (default: words.csv)")
-    ap.add_argument("--out", type=Path, default=Path("samples.json"), help="Output JSON path (default: samples.json)")
-    ap.add_argument("--n", type=int, default=50, help="Number of prompts to generate (default: 50)")
-    ap.add_argument("--k_per_sentiment", type=int, default=5, help="Words per sentiment (default: 5)")
-    args = ap.parse_args()
-    random.seed(123)
+def load_templates() -> dict:
+    """Read every prompt template once: (lang, prompt_id) -> template."""
+    return {
+        (lang, prompt_id): read_prompt(f"blackbox/word_association/prompts/{lang}/{prompt_id}.txt")
+        for lang in config["languages"]
+        for prompt_id in [1, 2, 3]
+    }
 
-    per_category_pn = read_words(args.csv)
+def words_by_idx(per_category_pn: dict) -> dict:
+    return {
+        item["idx"]: item
+        for by_sentiment in per_category_pn.values()
+        for items in by_sentiment.values()
+        for item in items
+    }
+
+def render_prompt(spec: dict, words: dict, templates: dict) -> dict:
+    """Expand a compact spec (word ids, template id, option order) into a full entry."""
+    lang = spec["language"]
+    words_seq = [words[idx][lang] for idx in spec["word_ids"]]
+    opts = OPTION_WORDS_DICT[lang][spec["with_or_without_none"]]
+    shuffled_opts = [opts[i] for i in spec["option_order"]]
+    formatted = templates[(lang, spec["prompt_id"])].format(
+        word_list=", ".join(words_seq),
+        len=len(words_seq),
+        len_labels=len(shuffled_opts),
+        option_words=join_options(shuffled_opts, lang),
+    )
+    return {
+        "id": spec["id"],
+        "prompt_id": spec["prompt_id"],
+        "words": words_seq,
+        "shuffled_options": shuffled_opts,
+        "formatted_prompt": formatted,
+        "temperature": spec["temperature"],
+        "model": spec["model"],
+        "language": lang,
+        "with_or_without_none": spec["with_or_without_none"],
+    }
+
+def iter_prompts(per_category_pn: dict, n: int, k_per_sentiment: int, templates: dict = None):
+    """Yield one prompt per (i, lang, model, with_or_without, category).
 
-    results = []
-    for i in range(1, args.n + 1):
+    Yields compact specs when `templates` is None, full entries otherwise.
+    Both consume the random stream identically, so a spec renders to the
+    same entry the full mode would have produced.
+    """
+    words = words_by_idx(per_category_pn)
+    for i in range(1, n + 1):
         for lang in config["languages"]:
             for model_name in config["models"]:
                 for with_or_without in config["with_or_without_none"]:
                     for category in per_category_pn.keys():
                         prompt_id = random.choice([1, 2, 3])
-                        pos_sample = random.sample(per_category_pn[category]["positive"], args.k_per_sentiment)
-                        neg_sample = random.sample(per_category_pn[category]["negative"], args.k_per_sentiment)
+                        pos_sample = random.sample(per_category_pn[category]["positive"], k_per_sentiment)
+                        neg_sample = random.sample(per_category_pn[category]["negative"], k_per_sentiment)
 
-                        words = pos_sample + neg_sample
-                        random.shuffle(words)
-
-                        words_seq = [word[lang] for word in words]
+                        sampled = pos_sample + neg_sample
+                        random.shuffle(sampled)
 
                         opts = OPTION_WORDS_DICT[lang][with_or_without]
-                        shuffled_opts = random.sample(opts, k=len(opts))
-                        joined_opts = join_options(shuffled_opts, lang)
-
-                        template_path = f"blackbox/cis_or_trans/prompts/{lang}/{prompt_id}.txt"
-                        prompt_template = read_prompt(template_path)
-
-                        formatted = prompt_template.format(
-                            word_list=", ".join(words_seq),
-                            len=len(words_seq),
-                            len_labels=len(shuffled_opts),
-                            option_words=joined_opts,
-                        )
-                        entry = {
+                        option_order = random.sample(range(len(opts)), k=len(opts))
+
+                        spec = {
                             "id": i,
                             "prompt_id": prompt_id,
-                            "words": words_seq,
-                            "shuffled_options": shuffled_opts,
-                            "formatted_prompt": formatted,
+                            "word_ids": [word["idx"] for word in sampled],
+                            "option_order": option_order,
                             "temperature": 0,
                             "model": model_name,
                             "language": lang,
                             "with_or_without_none": with_or_without,
                         }
-                        results.append(entry)
+                        yield spec if templates is None else render_prompt(spec, words, templates)
 
+def main():
+    ap = argparse.ArgumentParser(description="Sample prompts from CSV: 5 positive + 5 negative words, template id 1..3, repeated N times.")
+    ap.add_argument("--csv", type=Path, default=Path("blackbox/word_association/prompts/words_with_categories.csv"), help="Input CSV path (default: words.csv)")
+    ap.add_argument("--out", type=Path, default=Path("samples.json"), help="Output JSON path; a .jsonl path is written one prompt per line as it goes (default: samples.json)")
+    ap.add_argument("--n", type=int, default=50, help="Number of prompts to generate (default: 50)")
+    ap.add_argument("--k_per_sentiment", type=int, default=5, help="Words per sentiment (default: 5)")
+    ap.add_argument("--compact", action="store_true", help="Write only word ids, template id and option order; render with render_prompt at dispatch time (JSONL only)")
+    args = ap.parse_args()
+    random.seed(123)
+
+    per_category_pn = read_words(args.csv)
+    streaming = args.out.suffix == ".jsonl"
+    if args.compact and not streaming:
+        ap.error("--compact needs a .jsonl --out path")
+    prompts = iter_prompts(per_category_pn, args.n, args.k_per_sentiment, None if args.compact else load_templates())
+
+    count = 0
     with args.out.open("w", encoding="utf-8") as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+        if streaming:
+            for entry in prompts:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                count += 1
+        else:
+            results = list(prompts)
+            count = len(results)
+            json.dump(results, f, ensure_ascii=False, indent=2)
 
-    print(f"Wrote {len(results)} prompts to {args.out}")
+    print(f"Wrote {count} prompts to {args.out}")
 
 if __name__ == "__main__":
     main()
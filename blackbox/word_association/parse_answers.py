@@ -1,20 +1,24 @@
+import argparse
 import json
+import os
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
 import numpy as np
 import pandas as pd
 
 # ---------- Paths ----------
-ROOT = "blackbox/cis_or_trans"
+ROOT = "blackbox/word_association"
 CONFIG_PATH = f"{ROOT}/config.json"
 WORDS_PATH  = f"{ROOT}/prompts/words_with_categories.csv"
 RESULTS_PATH= f"{ROOT}/results/results.json"
 
-with open(CONFIG_PATH, "r") as f:
-    config = json.load(f)
-
-df_words = pd.read_csv(WORDS_PATH)
-
-rename_map = {c.lower(): c for c in df_words.columns}
+COLUMNS = [
+    "model","temperature","with_or_without_none","prompt_id",
+    "language","word_idx","word","label"
+]
 
 def _canon_label(raw: str, language: str) -> str | None:
     if raw is None:
@@ -38,14 +42,19 @@ def _canon_label(raw: str, language: str) -> str | None:
 
 def _labels_pattern(entry) -> re.Pattern:
     opts = entry.get("shuffled_options", []) or []
-    if not opts:
+    return _compiled_labels_pattern(bool(opts), tuple(o for o in opts if isinstance(o, str)))
+
+@lru_cache(maxsize=None)
+def _compiled_labels_pattern(has_opts: bool, opts: tuple) -> re.Pattern:
+    if not has_opts:
         alt = r"transgénero|cisgénero|ninguno|transgender|cisgender|none|both"
     else:
-        core = [re.escape(o.strip()) for o in opts if isinstance(o, str)]
+        core = [re.escape(o.strip()) for o in opts]
         core.append("both")
         alt = "|".join(core)
     return re.compile(rf"({alt})", flags=re.IGNORECASE)
 
+@lru_cache(maxsize=65536)
 def _line_regex(word: str, label_pat: re.Pattern) -> re.Pattern:
     # separators allowed: { ':', '-', '–', '—', or ≥1 space }
     # wraps: { (), [], {} } 
@@ -59,6 +68,7 @@ def _line_regex(word: str, label_pat: re.Pattern) -> re.Pattern:
         flags=re.IGNORECASE,
     )
 
+@lru_cache(maxsize=None)
 def _line_parts_regex(label_pat: re.Pattern) -> re.Pattern:
     sep = r"(?::|\-|\–|—|,|\s{1,})"
     open_wrap = r"(?:[\(\[\{]\s*)?"
@@ -69,33 +79,30 @@ def _line_parts_regex(label_pat: re.Pattern) -> re.Pattern:
         flags=re.IGNORECASE,
     )
 
+@lru_cache(maxsize=None)
 def _multi_pairs_regex(label_pat: re.Pattern) -> re.Pattern:
         label = f"({label_pat.pattern})"
         pat = rf"\s*(?:(?P<w1>[^,(){{}}\[\]]+?)\s*\(\s*(?P<lab1>{label})\s*\)|(?P<w2>[^,(){{}}\[\]]+?)\s*,\s*(?P<lab2>{label}))\s*"
         return re.compile(pat, flags=re.IGNORECASE)
 
-def parse_llm_answers(entries, df_words, language: str, mask: np.ndarray):
-    words_col = df_words[language].astype(str)
-    id2word = {i: words_col.iat[i].strip() for i in range(len(words_col))}
-    rows = []
+class _LabelMatcher:
+    """All compiled patterns for one label set, shared by every entry using it.
 
-    for entry in entries:
-        if entry.get("language") != language:
-            continue
-        txt = (entry.get("response") or "").strip()
-        
-        lines = [ln.strip() for ln in txt.splitlines() if ln.strip()]
-        label_pat = _labels_pattern(entry)
-        wow = entry.get("with_or_without_none", "")
-        model = entry.get("model", "")
-        temp  = entry.get("temperature", None)
-        pid   = entry.get("prompt_id", None)
+    `find_label` only runs a word's line regex on lines that can contain the
+    word: when both are ASCII, IGNORECASE matching reduces to comparing
+    lowercased text, so a plain substring check rules lines out exactly.
+    Non-ASCII text always goes through the regex.
+    """
+
+    def __init__(self, label_pat: re.Pattern):
+        self.label_pat = label_pat
+        self.parts_re = _line_parts_regex(label_pat)
+        self.multi_re = _multi_pairs_regex(label_pat)
 
-        parts_re = _line_parts_regex(label_pat)
-        multi_re = _multi_pairs_regex(label_pat)
+    def candidates(self, lines: list[str], language: str) -> dict[str, str]:
         cand2label: dict[str, str] = {}
         for ln in lines:
-            m = parts_re.match(ln)
+            m = self.parts_re.match(ln)
             if m:
                 cand = (m.group(1) or "").strip().lower()
                 raw_lab = m.group(2)
@@ -104,7 +111,7 @@ def parse_llm_answers(entries, df_words, language: str, mask: np.ndarray):
                     cand2label[cand] = canon
             pos = 0
             while True:
-                mm = multi_re.search(ln, pos)
+                mm = self.multi_re.search(ln, pos)
                 if not mm:
                     break
                 w = (mm.group('w1') or mm.group('w2') or '').strip().lower()
@@ -113,19 +120,47 @@ def parse_llm_answers(entries, df_words, language: str, mask: np.ndarray):
                 if w and canon is not None:
                     cand2label[w] = canon
                 pos = mm.end()
+        return cand2label
+
+    def find_label(self, word: str, lines: list[str], lowered: list) -> str | None:
+        line_pat = _line_regex(word, self.label_pat)
+        needle = word.lower() if word.isascii() else None
+        for ln, low in zip(lines, lowered):
+            if needle is not None and low is not None and needle not in low:
+                continue
+            m = line_pat.match(ln)
+            if m:
+                return m.group(1)
+        return None
+
+@lru_cache(maxsize=None)
+def _matcher(label_pat: re.Pattern) -> _LabelMatcher:
+    return _LabelMatcher(label_pat)
+
+def _parse_entries(entries, id2word: dict, language: str, mask: np.ndarray) -> list:
+    rows = []
+
+    for entry in entries:
+        if entry.get("language") != language:
+            continue
+        txt = (entry.get("response") or "").strip()
+
+        lines = [ln.strip() for ln in txt.splitlines() if ln.strip()]
+        lowered = [ln.lower() if ln.isascii() else None for ln in lines]
+        matcher = _matcher(_labels_pattern(entry))
+        wow = entry.get("with_or_without_none", "")
+        model = entry.get("model", "")
+        temp  = entry.get("temperature", None)
+        pid   = entry.get("prompt_id", None)
+
+        cand2label = matcher.candidates(lines, language)
 
         for idx in entry.get("word_ids", []):
             if idx is None or idx not in id2word or not mask[idx]:
                 continue
             word = id2word[idx]
 
-            found_label = None
-            line_pat = _line_regex(word, label_pat)
-            for ln in lines:
-                m = line_pat.match(ln)
-                if m:
-                    found_label = m.group(1)
-                    break
+            found_label = matcher.find_label(word, lines, lowered)
 
             if found_label is None:
                 found_label = cand2label.get(word.strip().lower())
@@ -139,8 +174,143 @@ def parse_llm_answers(entries, df_words, language: str, mask: np.ndarray):
 
             rows.append((model, temp, wow, pid, language, idx, word, canon))
 
-    out = pd.DataFrame(rows, columns=[
-        "model","temperature","with_or_without_none","prompt_id",
-        "language","word_idx","word","label"
-    ])
-    return out
\ No newline at end of file
+    return rows
+
+def _id2word(df_words, language: str) -> dict:
+    words_col = df_words[language].astype(str)
+    return {i: words_col.iat[i].strip() for i in range(len(words_col))}
+
+def parse_llm_answers(entries, df_words, language: str, mask: np.ndarray):
+    rows = _parse_entries(entries, _id2word(df_words, language), language, mask)
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+# ---------- Parallel parsing ----------
+_worker_state = {}
+
+def _init_worker(id2word: dict, language: str, mask: np.ndarray):
+    # Sent once per worker process instead of once per chunk
+    _worker_state.update(id2word=id2word, language=language, mask=mask)
+
+def _parse_chunk(entries: list) -> pd.DataFrame:
+    rows = _parse_entries(entries, _worker_state["id2word"], _worker_state["language"], _worker_state["mask"])
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+def _chunks(entries, size: int):
+    it = iter(entries)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+def parse_llm_answers_parallel(
+    entries,
+    df_words,
+    language: str,
+    mask: np.ndarray,
+    chunk_size: int = 2000,
+    max_workers: int = None,
+):
+    """Same output as `parse_llm_answers`, parsed in chunks by a process pool.
+
+    `entries` may be any iterable (e.g. `iter_results`); at most two chunks
+    per worker are held in memory at a time, and chunk results are
+    concatenated in input order.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    frames = []
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(_id2word(df_words, language), language, mask),
+    ) as executor:
+        pending = deque()
+        for chunk in _chunks(entries, chunk_size):
+            if len(pending) >= 2 * max_workers:
+                frames.append(pending.popleft().result())
+            pending.append(executor.submit(_parse_chunk, chunk))
+        while pending:
+            frames.append(pending.popleft().result())
+    if not frames:
+        return pd.DataFrame([], columns=COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+# ---------- Streaming reader ----------
+def iter_results(path: str, buffer_size: int = 1 << 20):
+    """Yield the entries of a results file one at a time.
+
+    Reads either a JSON array (as written by json.dump) or JSONL, without
+    loading the whole file into memory.
+    """
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = f.read(buffer_size)
+        eof = not buf
+        pos = _skip(buf, 0, " \t\r\n")
+        while pos == len(buf) and not eof:
+            more = f.read(buffer_size)
+            eof = not more
+            buf += more
+            pos = _skip(buf, pos, " \t\r\n")
+        if not buf.startswith("[", pos):
+            raise ValueError(f"{path} does not contain a JSON array")
+        pos += 1
+        while True:
+            # Decode in place at `pos`; the consumed head of the buffer is
+            # only dropped when more of the file is read in
+            pos = _skip(buf, pos, " \t\r\n,")
+            if buf.startswith("]", pos):
+                return
+            try:
+                entry, end = decoder.raw_decode(buf, pos)
+                if end == len(buf) and not eof:
+                    # A number at the end of the buffer may go on in the next read
+                    raise json.JSONDecodeError("Value may be truncated", buf, end)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(buffer_size)
+                eof = not more
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+            yield entry
+            pos = end
+
+def _skip(buf: str, pos: int, chars: str) -> int:
+    while pos < len(buf) and buf[pos] in chars:
+        pos += 1
+    return pos
+
+def main():
+    ap = argparse.ArgumentParser(description="Parse word-association answers into one row per labelled word.")
+    ap.add_argument("--results", default=RESULTS_PATH, help=f"Results file, JSON array or JSONL (default: {RESULTS_PATH})")
+    ap.add_argument("--out", default=f"{ROOT}/results/parsed_answers.csv", help="Output CSV path")
+    ap.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count; 1 parses in-process)")
+    ap.add_argument("--chunk_size", type=int, default=2000, help="Entries per chunk sent to a worker (default: 2000)")
+    args = ap.parse_args()
+
+    with open(CONFIG_PATH, "r") as f:
+        config = json.load(f)
+    df_words = pd.read_csv(WORDS_PATH)
+    mask = np.ones(len(df_words), dtype=bool)
+
+    frames = []
+    for language in config["languages"]:
+        if args.workers == 1:
+            frames.append(parse_llm_answers(iter_results(args.results), df_words, language, mask))
+        else:
+            frames.append(parse_llm_answers_parallel(
+                iter_results(args.results), df_words, language, mask,
+                chunk_size=args.chunk_size, max_workers=args.workers,
+            ))
+    out = pd.concat(frames, ignore_index=True)
+    out.to_csv(args.out, index=False)
+    print(f"Wrote {len(out)} parsed labels to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import json
+import random
+import sys
+import time
+import numpy as np
+import pandas as pd
+from blackbox.word_association.parse_answers import WORDS_PATH, iter_results, parse_llm_answers, parse_llm_answers_parallel
+from blackbox.word_association.regression import reference_parser
+
+# ---------- Paths ----------
+ROOT = "blackbox/word_association/regression"
+CORPUS_PATH = f"{ROOT}/responses.jsonl"
+CORPUS_WORDS_PATH = f"{ROOT}/words.csv"
+
+LANGUAGES = ["english", "spanish"]
+LABELS = {"english": ["cisgender", "transgender", "none"], "spanish": ["cisgénero", "transgénero", "ninguno"]}
+EXTRA_LABELS = ["both", "Neither", "CIS", "Trans", "cisgénero", "Cisgender"]
+SEPARATORS = [": ", " - ", " – ", "—", ", ", "  ", " (", " [", ":", ": ("]
+CLOSINGS = ["", ")", "]", ".", " .", "!", "?", " because reasons", ", clearly"]
+PREFIXES = ["", "- ", "* ", "• ", "1. ", "2) ", "10 - ", "3."]
+# Words whose case folding differs between the regex and str.lower(), plus a multi-word one
+EXTRA_WORDS = [
+    ["ſad", "ſad", "negative", "no", "x"],
+    ["İdol", "İdol", "negative", "no", "x"],
+    ["good person", "buena persona", "positive", "no", "x"],
+]
+
+def _response(rng: random.Random, words: list, opts: list) -> str:
+    mode = rng.random()
+    if mode < 0.15:
+        return ", ".join(f"{w} ({rng.choice(opts + EXTRA_LABELS)})" for w in words)
+    if mode < 0.25:
+        return "; ".join(f"{w}, {rng.choice(opts + EXTRA_LABELS)}" for w in words)
+    lines = []
+    for w in words:
+        if rng.random() < 0.1:
+            continue
+        variant = rng.choice([w, w.upper(), w.capitalize(), w.lower(), w + "s", w.replace("s", "ſ"), w.replace("i", "İ"), "**" + w + "**"])
+        lines.append(f"{rng.choice(PREFIXES)}{variant}{rng.choice(SEPARATORS)}{rng.choice(opts + EXTRA_LABELS)}{rng.choice(CLOSINGS)}")
+    if rng.random() < 0.2:
+        lines.insert(0, "Here are the labels:")
+    return "\n".join(lines)
+
+def build_corpus(n: int = 2000, seed: int = 0):
+    """Word list and synthetic responses covering bullets, wraps, separators,
+    case and Unicode case-folding variants, multi-pair lines, masked and
+    unknown word ids."""
+    rng = random.Random(seed)
+    df_words = pd.read_csv(WORDS_PATH)
+    for row in EXTRA_WORDS:
+        df_words.loc[len(df_words)] = row
+    entries = []
+    for _ in range(n):
+        lang = rng.choice(LANGUAGES)
+        ids = rng.sample(range(len(df_words)), 10)
+        if rng.random() < 0.3:
+            ids[:3] = [len(df_words) - 1, len(df_words) - 2, len(df_words) - 3]
+        words = [df_words[lang].iat[j] for j in ids]
+        opts = rng.sample(LABELS[lang][:rng.choice([2, 3])], k=2)
+        if rng.random() < 0.1:
+            opts = []
+        entries.append({
+            "language": lang,
+            "response": _response(rng, words, opts or LABELS[lang]),
+            "shuffled_options": opts,
+            "word_ids": ids + [None, 99999],
+            "with_or_without_none": rng.choice(["with_none", "without_none"]),
+            "model": "m",
+            "temperature": 0,
+            "prompt_id": 1,
+        })
+    return df_words, entries
+
+def main():
+    ap = argparse.ArgumentParser(description="Check that parse_answers labels the regression corpus exactly like the reference parser.")
+    ap.add_argument("--rebuild", action="store_true", help="Regenerate the corpus and word list before checking")
+    ap.add_argument("--workers", type=int, default=2, help="Processes for the parallel parser (default: 2)")
+    args = ap.parse_args()
+
+    if args.rebuild:
+        df_words, entries = build_corpus()
+        df_words.to_csv(CORPUS_WORDS_PATH, index=False)
+        with open(CORPUS_PATH, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        print(f"Wrote {len(entries)} responses to {CORPUS_PATH}")
+
+    df_words = pd.read_csv(CORPUS_WORDS_PATH)
+    entries = list(iter_results(CORPUS_PATH))
+    mask = np.ones(len(df_words), dtype=bool)
+    mask[5] = False
+
+    ok = True
+    for language in LANGUAGES:
+        t = time.perf_counter()
+        expected = reference_parser.parse_llm_answers(entries, df_words, language, mask)
+        t_reference = time.perf_counter() - t
+        t = time.perf_counter()
+        current = parse_llm_answers(entries, df_words, language, mask)
+        t_current = time.perf_counter() - t
+        parallel = parse_llm_answers_parallel(iter(entries), df_words, language, mask, chunk_size=500, max_workers=args.workers)
+        same = expected.equals(current) and expected.equals(parallel)
+        ok = ok and same
+        print(
+            f"{language}: {len(expected)} rows, {'identical' if same else 'DIFFERENT'}; "
+            f"reference {t_reference:.2f}s, current {t_current:.2f}s"
+        )
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()